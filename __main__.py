@@ -4,10 +4,17 @@ __version__ = "1.0.0"
 
 if __name__ == "__main__":
 
+    import sys
+
+    # Batch mode, which only imports the core modules
+    if len(sys.argv) > 1 and sys.argv[1] == "estimate":
+        from core.cli import main
+
+        sys.exit(main(sys.argv[1:]))
+
     # Import PyQt modules
     from PyQt5.QtCore import Qt
     from PyQt5.QtWidgets import QApplication
-    import sys
 
     QApplication.setAttribute(Qt.AA_EnableHighDpiScaling, True)
     QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps, True)
@@ -27,4 +34,4 @@ if __name__ == "__main__":
         ex.project.open(fname=sys.argv[1])
         ex.setCursorNormal()
 
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec_())
\ No newline at end of file
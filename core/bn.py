@@ -1,12 +1,17 @@
 import math
+import threading
 from pathlib import Path
-from typing import Dict, List, Tuple, Union
+from typing import Dict, Iterator, List, Set, Tuple, Union
 import re
 
 import numpy as np
 import ast
+from pydantic import PrivateAttr
 
+from core.conditioning import ConditioningEngine, covariance_factor
+from core.graph import Graph
 from core.models import *
+from core.rng import RandomStreams
 
 
 def corr_string(r: Union[float, None], i: int, j: int, cond: tuple = None, offset: int = 0) -> str:
@@ -64,11 +69,8 @@ def _ranktopearson(R: float) -> float:
         return r
 
 
-_vranktopearson = np.vectorize(_ranktopearson)
-
-
 def ranktopearson(R: Union[np.ndarray, float]) -> Union[np.ndarray, float]:
-    """Wrapper function of the non-vectorized and vectorized rank to perason function
+    """Wrapper function of the scalar and array rank to perason function
 
     Parameters
     ----------
@@ -81,7 +83,7 @@ def ranktopearson(R: Union[np.ndarray, float]) -> Union[np.ndarray, float]:
         Pearson's correlation
     """
     if isinstance(R, np.ndarray):
-        return _vranktopearson(R)
+        return np.where(np.abs(R) == 1, R, 2 * np.sin((np.pi / 6) * R)).astype(np.float64)
     else:
         return _ranktopearson(R)
 
@@ -106,11 +108,8 @@ def _pearsontorank(r: float) -> float:
         return R
 
 
-_vpearsontorank = np.vectorize(_pearsontorank)
-
-
 def pearsontorank(r: Union[np.ndarray, float]) -> Union[np.ndarray, float]:
-    """Wrapper function of the non-vectorized and vectorized Pearson to rank function
+    """Wrapper function of the scalar and array Pearson to rank function
 
     Parameters
     ----------
@@ -123,11 +122,119 @@ def pearsontorank(r: Union[np.ndarray, float]) -> Union[np.ndarray, float]:
         Rank correlation
     """
     if isinstance(r, np.ndarray):
-        return _vpearsontorank(r)
+        return np.where(np.abs(r) == 1, r, (6 / np.pi) * np.arcsin(r / 2)).astype(np.float64)
     else:
         return _pearsontorank(r)
 
 
+def _cholesky(A: np.ndarray) -> np.ndarray:
+    """Cholesky factor of a correlation matrix. Positive semi-definite matrices (e.g. with
+    perfectly correlated nodes) get zero columns for the dependent nodes."""
+    try:
+        return np.linalg.cholesky(A)
+    except np.linalg.LinAlgError:
+        n = len(A)
+        L = np.zeros_like(A, dtype=np.float64)
+        for k in range(n):
+            d = A[k, k] - L[k, :k] @ L[k, :k]
+            if d > 1e-12:
+                L[k, k] = np.sqrt(d)
+                L[k + 1 :, k] = (A[k + 1 :, k] - L[k + 1 :, :k] @ L[k, :k]) / L[k, k]
+        return L
+
+
+def _parent_factor(R: np.ndarray, cond_rank_corrs: List[float]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Cholesky factor of the correlations among the parents of a node, and the node's row of
+    the Cholesky factor with respect to its parents. The conditional correlation with parent t,
+    given parents 1 to t-1, is the row element divided by the standard deviation that remains
+    after parents 1 to t-1.
+
+    Parameters
+    ----------
+    R : np.ndarray
+        Pearson correlation matrix of the parents, in the order of the edges
+    cond_rank_corrs : List[float]
+        Conditional rank correlations of the edges
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray]
+        Cholesky factor of R, row of the node, and the remaining variance of the node before each parent
+    """
+    L = _cholesky(R)
+
+    T = ranktopearson(np.asarray(cond_rank_corrs, dtype=np.float64))
+    ell = np.zeros(len(T))
+    remaining = np.ones(len(T))
+    variance = 1.0
+    for t, tau in enumerate(T):
+        remaining[t] = variance
+        ell[t] = tau * np.sqrt(variance)
+        variance = max(variance - ell[t] ** 2, 0.0)
+
+    return L, ell, remaining
+
+
+def _edge_bounds(R: np.ndarray, cond_rank_corrs: List[float]) -> List[Tuple[float, float]]:
+    """Bounds of the rank correlations of the edges of a node, by calculating the correlation
+    that would result from imposing a conditional -1 and 1 correlation on the edge.
+
+    Parameters
+    ----------
+    R : np.ndarray
+        Rank correlation matrix of the parents, in the order of the edges
+    cond_rank_corrs : List[float]
+        Conditional rank correlations of the edges
+
+    Returns
+    -------
+    List[Tuple[float, float]]
+        Lower and upper bound per edge
+    """
+    L, ell, remaining = _parent_factor(ranktopearson(R), cond_rank_corrs)
+
+    # Correlation with each parent for a conditional correlation of -1 and 1, given the
+    # (actual) conditional correlations with the previous parents
+    explained = np.array([L[t, :t] @ ell[:t] for t in range(len(cond_rank_corrs))])
+    half_range = np.diag(L) * np.sqrt(remaining)
+
+    bounds = [(-1.0, 1.0)]
+    for t in range(1, len(cond_rank_corrs)):
+        bounds.append(
+            (
+                pearsontorank(max(explained[t] - half_range[t], -1.0)),
+                pearsontorank(min(explained[t] + half_range[t], 1.0)),
+            )
+        )
+    return bounds[: len(cond_rank_corrs)]
+
+
+def calculate_bounds_snapshot(snapshot: Dict, progress_callback=None) -> Dict:
+    """Calculate the correlation bounds for a snapshot of the network (see
+    BayesianNetwork.bounds_snapshot). Only uses the copies in the snapshot, so it can run
+    in a background thread while the network is edited.
+
+    Parameters
+    ----------
+    snapshot : Dict
+        Snapshot with the inputs per node
+    progress_callback : callable, optional
+        Unused, for running in a worker, by default None
+
+    Returns
+    -------
+    Dict
+        The snapshot, with the bounds per node under "bounds"
+    """
+    result = dict(snapshot)
+    result["bounds"] = {name: _edge_bounds(R, corrs) for name, (R, corrs) in snapshot["nodes"].items()}
+    return result
+
+
+# Bounds may be requested from several places, e.g. while saving and showing the network
+_bounds_lock = threading.RLock()
+
+
 class BayesianNetwork(BaseModel):
 
     # List of nodes
@@ -136,15 +243,40 @@ class BayesianNetwork(BaseModel):
     # Correlation matrix
     R: np.ndarray = np.empty((0, 0), dtype=float)
 
-    # Dictionary with partial correlations
-    partcorrs: Dict[Tuple, float] = {}
-
     # List of edges. This is not used for calculations, as the nodes parents
     # already contain all information on the edges
     edgelist: List[Edge] = []
 
     charlist: List[ProjectCharacteristics] = []
 
+    # Root seed for the random streams of the estimate, stored to make runs reproducible
+    seed: Union[int, None] = None
+
+    # Node names and sampling order for which R was calculated, to update R incrementally
+    _correlation_order: Union[Tuple[List[str], List[int]], None] = PrivateAttr(default=None)
+
+    # Nodes of which the bounds of the edges are not calculated for the current correlations
+    _stale_bounds: Set[str] = PrivateAttr(default_factory=set)
+
+    # Pearson form of R, its factor and the conditioning engine, for the R they were calculated from
+    _factorization: Union[Dict, None] = PrivateAttr(default=None)
+
+    # Indexed structure of the network, created on first use after a structural edit
+    _graph: Union[Graph, None] = PrivateAttr(default=None)
+
+    @property
+    def graph(self) -> Graph:
+        """Indexed structure of the network (name to index map, parent and child adjacency
+        and the topological order)"""
+        if self._graph is None:
+            self._graph = Graph(names=[node.name for node in self.nodes], parent_names=[node.parent_names for node in self.nodes])
+        return self._graph
+
+    def invalidate_graph(self) -> None:
+        """Discard the indexed structure after a structural edit. Edits through the methods of
+        this class do this themselves, other edits of the nodes or their edges need to call it."""
+        self._graph = None
+
     def add_char(
             self,
             project_name: str = None,
@@ -223,6 +355,7 @@ class BayesianNetwork(BaseModel):
 
         newnode = Node(name=name, edges=edges, distribution=distribution, parameters_small=parameters_small, parameters_large=parameters_large, condition=condition)
         self.nodes.append(newnode)
+        self.invalidate_graph()
 
     def remove_node(self, name: str) -> None:
         """Removes a node from the project. The given node is removed.
@@ -235,14 +368,15 @@ class BayesianNetwork(BaseModel):
             Name of node to remove.
         """
 
-        inode = self._node_names.index(name)
-        node = self.nodes[inode]
-        self.nodes.remove(node)
+        inode = self.graph.index[name]
+        children = [self.nodes[i] for i in self.graph.children[inode]]
+        del self.nodes[inode]
 
         # Remove edges connected to this node in other nodes
-        for node in self.nodes:
-            if name in node.parent_names:
-                self.remove_edge(parent=name, child=node.name)
+        for node in children:
+            del node.edges[node.parent_index(name)]
+
+        self.invalidate_graph()
 
     def remove_edge(self, parent: str, child: str) -> None:
         """Removes an edge from the BN. All node's parents are checked
@@ -256,11 +390,11 @@ class BayesianNetwork(BaseModel):
             Edge destination
         """
 
-        inode = self._node_names.index(child)
-        node = self.nodes[inode]
+        node = self._get_node_by_name(child)
 
         iedge = node.parent_index(parent)
-        node.edges.remove(node.edges[iedge])
+        del node.edges[iedge]
+        self.invalidate_graph()
 
     def _get_unused_name(self) -> str:
         """Generates a node name that is not used already
@@ -272,7 +406,7 @@ class BayesianNetwork(BaseModel):
         """
         newid = len(self.nodes) + 1
         newname = f"Node {newid}"
-        while newname in self._node_names:
+        while newname in self.graph.index:
             newid += 1
             newname = f"Node {newid}"
         return newname
@@ -305,20 +439,19 @@ class BayesianNetwork(BaseModel):
         if parent_name in node.parent_names:
             raise ValueError(f'An edge from "{parent_name}" to "{child_name}" already exists.')
 
+        # The edge creates a cycle if the parent can be reached from the child
+        graph = self.graph
+        iparent, ichild = graph.index[parent_name], graph.index[child_name]
+        if graph.reaches(ichild, iparent):
+            return False
+
         # Create edge
         edge = Edge(parent=parent_name, child=child_name, cond_rank_corr=cond_rank_corr)
 
         node.edges.append(edge)
+        graph.add_edge(iparent, ichild)
 
-        if not self.is_dag:
-            self.remove_edge(parent_name, child_name)
-            return False
-
-        else:
-            # Make sure the edges are ordered by sampling order
-            # self.check_sampling_order()
-
-            return True
+        return True
 
     def reverse_edge(self, parent_name: str, child_name: str) -> bool:
         """Reverse an existing edge in the BN. This is done by removing the old edge,
@@ -368,31 +501,40 @@ class BayesianNetwork(BaseModel):
 
     def _get_node_by_name(self, name: str) -> Node:
         """Get a node object by its name"""
-        return self.nodes[self._node_names.index(name)]
+        return self.nodes[self.graph.index[name]]
 
     def change_node_name(self, oldname: str, newname: str) -> None:
         """Change node name"""
 
-        # Create a list of other names
-        names = self._node_names
-        inode = names.index(oldname)
-        names.remove(names[inode])
+        index = self.graph.index
 
         # Check if newname is already in use by a different node
-        if newname in names:
+        if newname in index and index[newname] != index[oldname]:
             raise ValueError(f'Name "{newname}" is already in use.')
 
         # Rename nodes
-        node = self._get_node_by_name(oldname)
+        inode = index[oldname]
+        node = self.nodes[inode]
         node.name = newname
         for edge in node.edges:
             edge.child = newname
 
-        for node in self.nodes:
-            # Change name in parents
-            if oldname in node.parent_names:
-                iparent = node.parent_index(oldname)
-                node.edges[iparent].parent = newname
+        # Change name in the children's parents
+        for ichild in self.graph.children[inode]:
+            child = self.nodes[ichild]
+            child.edges[child.parent_index(oldname)].parent = newname
+
+        self.invalidate_graph()
+
+        # Renaming does not change the correlations
+        with _bounds_lock:
+            if oldname in self._stale_bounds:
+                self._stale_bounds.remove(oldname)
+                self._stale_bounds.add(newname)
+
+        if self._correlation_order is not None:
+            names, sampling_order = self._correlation_order
+            self._correlation_order = ([newname if name == oldname else name for name in names], sampling_order)
 
         self.create_edge_overview()
 
@@ -427,50 +569,14 @@ class BayesianNetwork(BaseModel):
     def get_valid_sampling_order(self) -> List[int]:
         """Construct a valid sampling order. This means that the node with no
         parents will be the first in the sampling order (SO) and so forth.
+        The order is cached until the structure of the network changes.
 
         Returns
         -------
         List[int]
             indices with the sampling order
         """
-
-        nnodes = len(self.nodes)
-        names = self._node_names
-
-        # Add disconnected nodes to the end of the list
-        disconnected = set(names)
-        for node in self.nodes:
-            # Remove nodes that are a parent (and therefore connected)
-            disconnected = disconnected.difference(set(node.parent_names))
-
-        disconnected = list(disconnected)
-
-        for name in reversed(disconnected):
-            node = self._get_node_by_name(name)
-            # Remove nodes that do not have parents
-            if len(node.edges) != 0:
-                disconnected.remove(node.name)
-        names = [n for n in names if not n in disconnected] + [n for n in names if n in disconnected]
-
-        unassigned = names[:]
-
-        # Constructing a valid 'sampling order', which means that the node with no
-        # parents will be the first in the sampling order (SO) and so forth.
-        sampling_order = []
-        while len(sampling_order) < nnodes:
-            # Loop over all unassigned nodes
-            for i, name in enumerate(unassigned.copy()):
-                # Get the parents of the specific nodes
-                unassigned_parents = set(self._get_node_by_name(name).parent_names).difference(sampling_order)
-                # If all parents are assigned, the node can be added to the sampling order
-                if len(unassigned_parents) == 0:
-                    sampling_order.append(name)
-                    unassigned.remove(name)
-
-        names = self._node_names
-        sampling_order = [names.index(name) for name in sampling_order]
-
-        return sampling_order
+        return list(self.graph.order)
 
     def check_sampling_order(self) -> None:
         """Currently unused"""
@@ -489,27 +595,29 @@ class BayesianNetwork(BaseModel):
 
         # Change the node list to this order
         self.nodes[:] = [self.nodes[si] for si in valid_order]
+        self.invalidate_graph()
 
         # Change each node's edges to this order
+        index = self.graph.index
         for node in self.nodes:
-            index = [node.parent_index(name) for name in self._node_names if name in node.parent_names]
-            node.edges[:] = [node.edges[i] for i in index]
+            node.edges.sort(key=lambda edge: index[edge.parent])
+        self.invalidate_graph()
 
         # If the orders did not match, the conditional correlations need to be changed from the observed correlations
 
         if current_order != valid_order:
             # First, change the order of the correlation matrix
-            names = self._node_names
-            order = [current_order.index(node) for node in names]
+            order = valid_order
             self.R = self.R[np.ix_(order, order)]
 
             # Iterate over all edges, and create conditional correlation from observed correlation, that shouldn't change
             self.create_edge_overview()
+            index = self.graph.index
             for edge in self.edgelist:
                 edge.cond_rank_corr = self.calculate_conditional_correlation(
                     edge.parent,
                     edge.child,
-                    observed=self.R[names.index(edge.parent), names.index(edge.child)],
+                    observed=self.R[index[edge.parent], index[edge.child]],
                 )
 
     def change_parent_order(self, source_pos: int, target_pos: int) -> None:
@@ -544,190 +652,257 @@ class BayesianNetwork(BaseModel):
         self.create_edge_overview()
 
         if order_changed:
+            self.invalidate_graph()
+
             # Recalculate the conditional correlations from the observed correlations
-            names = self._node_names
+            index = self.graph.index
             for edge in self.edgelist:
                 edge.cond_rank_corr = self.calculate_conditional_correlation(
                     edge.parent,
                     edge.child,
-                    observed=self.R[names.index(edge.parent), names.index(edge.child)],
+                    observed=self.R[index[edge.parent], index[edge.child]],
                 )
 
     @property
     def is_dag(self) -> bool:
-        """Checks whether the netwerk is a directed acyclic graph"""
-
-        names = self._node_names
-
-        def _check_parents(node, name):
-            if name in node.parent_names:
-                return False
-
-            for parent_name in node.parent_names:
-                parent_node = self.nodes[names.index(parent_name)]
-                dag = _check_parents(parent_node, name)
-                if not dag:
-                    return False
-
-            return True
-
-        for node in self.nodes:
-            if not _check_parents(node, node.name):
-                return False
+        """Checks whether the netwerk is a directed acyclic graph, with one topological sort"""
+        try:
+            self.graph.order
+        except ValueError:
+            return False
 
         return True
 
-    def calculate_correlation_matrix(self) -> None:
+    def calculate_correlation_matrix(self, start: int = 0) -> None:
         """Calculates correlation matrix (i.e., non-conditional) from BN and (conditional)
         rank correlations.
+
+        The conditional correlations of a node with its parents determine its row of the Cholesky
+        factor with respect to the parents. Combined with the Cholesky factor of the correlations
+        among the parents, this gives the regression coefficients of the node on its parents,
+        from which the correlations with all nodes before it in the sampling order follow.
+
+        Parameters
+        ----------
+        start : int, optional
+            Position in the sampling order from which the correlations are calculated. The
+            correlations of a node only depend on the nodes before it in the sampling order,
+            so those of earlier nodes are kept. R must be up to date for these nodes. By default 0 (all)
         """
 
         nnodes = len(self.nodes)
-        names = self._node_names
+        graph = self.graph
 
-        # Initializing the correlation matrix R
-        self.R = np.zeros((nnodes, nnodes), dtype=np.float64)
-        np.fill_diagonal(self.R, 1.0)
+        sampling_order = graph.order
 
-        # Clear the dictionary to save partial correlations that have been calculated
-        # and might be used again
-        self.partcorrs.clear()
+        if start <= 0:
+            # Initializing the correlation matrix R
+            R = np.eye(nnodes, dtype=np.float64)
 
-        sampling_order = self.get_valid_sampling_order()
-        # Starting the loop for recursively calculating the correlation matrix by
-        # the second node (the first sampling node has no parents)
-        for i in range(1, nnodes):
-            # Get the index in the sampling order
+        else:
+            # Clear the correlations of the nodes from the start position, and keep the others
+            R = ranktopearson(self.R)
+            affected = sampling_order[start:]
+            R[affected, :] = 0.0
+            R[:, affected] = 0.0
+            R[affected, affected] = 1.0
+
+        # The first node in the sampling order has no parents
+        for i in range(max(1, start), nnodes):
             si = sampling_order[i]
+            edges = self.nodes[si].edges
+            if len(edges) == 0:
+                continue
+
+            parents = graph.parents[si]
+            previous = sampling_order[:i]
 
-            # Variables for the looping
-            cond = []  # Vector storing the conditionalized variables
-            T = {}
-
-            parents = [names.index(edge.parent) for edge in self.nodes[si].edges]
-            # Contains the previous (same order of SO!) nodes that are not parents
-            previous_other = set(sampling_order[:i]).difference(parents)
-
-            # Loop over all parents, and calculate the correlation between the node and its parents
-            for edge in self.nodes[si].edges:
-                j = names.index(edge.parent)
-                rpc = edge.cond_rank_corr
-
-                # Get the rank-correlation to the parent
-                T[(si, j)] = ranktopearson(rpc)
-
-                # Get the conditional correlation r1,2;conditions
-                s = T[(si, j)]
-
-                # Loop over all conditioning nodes in reverse order, to calculate the unconditional correlation r1,2
-                for k in reversed(range(len(cond))):
-
-                    # Recursivelly calculating the correlation between nodes accounting for the conditional/partial correlation
-                    r1 = self.calculate_partial_correlation(i=j, j=cond[k], cond=cond[:k])
-
-                    # Based on the conditional/partial correlation, calculating the resulting correlation coefficient
-                    # (all the properties of the correlation matrix are guaranteed)
-                    shat = s * np.sqrt((1 - T[(si, cond[k])] ** 2) * (1 - (r1) ** 2)) + T[(si, cond[k])] * r1
-                    s = shat
-
-                # Saving the correlation coefficients calculated in the upper and lower triangle of the matrix R.
-                self.R[si, j] = s
-                self.R[j, si] = s
-
-                cond.append(j)
-
-            # Looping over the previous nodes (based on the ordering in SO) which
-            # are not parents, stored in previous_other.
-            for j in previous_other:
-                T[(si, j)] = 0
-                s = T[(si, j)]
-                for k in reversed(range(len(cond))):
-                    if T[(si, cond[k])] != 0 or s != 0:
-                        # Recursively calculating the correlation between nodes accounting for the conditional/partial correlation
-                        r1 = self.calculate_partial_correlation(j, cond[k], cond[0:k])
-                        # Based on the conditional/partial correlation, calculating the resulting correlation coefficient
-                        # (all the properties of the correlation matrix are guaranteed)
-                        shat = s * np.sqrt((1 - T[(si, cond[k])] ** 2) * (1 - (r1) ** 2)) + T[(si, cond[k])] * r1
-                        s = shat
-
-                # Storing the results
-                self.R[si, j] = s
-                self.R[j, si] = s
-                cond.append(j)
-
-        self.R = pearsontorank(self.R)
-
-    def calculate_correlation_bounds(self) -> None:
-        """Calculates the bounds of the rank correlations in the network. Specified (conditional)
-        rank correlation coefficients limit the range of the correlation for other edges. This function
-        calculates these limits, by calculating the correlation that would result from imposing a
-        conditional -1 and 1 correlation on the edge. This function can be used to display the
-        possible range of correlations to a user.
+            # Regression coefficients of the node on its parents
+            L, ell, _ = _parent_factor(R[np.ix_(parents, parents)], [edge.cond_rank_corr for edge in edges])
+            weights = np.linalg.lstsq(L.T, ell, rcond=None)[0]
+
+            # Correlations with all previous nodes, which are conditionally independent given the parents
+            R[si, previous] = R[np.ix_(previous, parents)] @ weights
+            R[previous, si] = R[si, previous]
+
+        self.R = pearsontorank(R)
+        self._correlation_order = (list(graph.names), list(sampling_order))
+
+    def update_correlation_matrix(self, changed: List[str]) -> None:
+        """Update the correlation matrix, bounds and edge overview after an edit of the
+        changed nodes (e.g. their edges or conditional correlations). The correlations do
+        not depend on which valid sampling order is used, so only the nodes from the first
+        changed node in the new sampling order are recalculated. If nodes were removed or
+        reordered, everything is recalculated.
+
+        Parameters
+        ----------
+        changed : List[str]
+            Names of the nodes that changed
         """
+        graph = self.graph
+        names = graph.names
+        nnodes = len(names)
+
+        start = 0
+        if self._correlation_order is not None:
+            previous_names, _ = self._correlation_order
+            nprevious = len(previous_names)
+
+            # Only incremental if the existing nodes kept their position (nodes may be added)
+            if names[:nprevious] == previous_names and self.R.shape == (nprevious, nprevious):
+                # Extend the correlation matrix for added nodes
+                if nnodes > nprevious:
+                    R = np.eye(nnodes)
+                    R[:nprevious, :nprevious] = self.R
+                    self.R = R
+
+                # First position of a changed node
+                position = graph.position
+                start = min([position[graph.index[name]] for name in changed if name in graph.index], default=nnodes)
+
+        self.calculate_correlation_matrix(start=start)
+        self.calculate_correlation_bounds(start=start)
+        self.create_edge_overview()
 
-        nnodes = len(self.nodes)
-        names = self._node_names
+    def calculate_correlation_bounds(self, start: int = 0) -> None:
+        """Updates the (non-conditional) rank correlations and labels of the edges, after the
+        correlation matrix changed. Specified (conditional) rank correlation coefficients limit the
+        range of the correlation for other edges. These bounds are only needed when an edge is shown
+        or edited, so they are marked as stale here and calculated on request, with
+        get_correlation_bounds or update_correlation_bounds.
+
+        Parameters
+        ----------
+        start : int, optional
+            Position in the sampling order from which the correlations changed, by default 0 (all)
+        """
+        graph = self.graph
 
-        # Convert to correlation matrix to pearson, for calculating the partial correlations
-        self.R = ranktopearson(self.R)
+        with _bounds_lock:
+            if start <= 0:
+                self._stale_bounds.clear()
 
-        sampling_order = self.get_valid_sampling_order()
-        # Starting the loop for recursively calculating the correlation matrix by
-        # the second node
-        for i in range(1, nnodes):
+            for si in graph.order[max(1, start) :]:
+                edges = self.nodes[si].edges
+                if len(edges) == 0:
+                    continue
 
-            si = sampling_order[i]
+                parents = graph.parents[si]
+                for t, (edge, pi) in enumerate(zip(edges, parents)):
+                    cond = sorted(parents[:t]) if t > 0 else None
+                    edge.string = corr_string(r=None, i=pi, j=si, cond=cond, offset=1)
+                    edge.rank_corr = float(self.R[si, pi])
+
+                self._stale_bounds.add(self.nodes[si].name)
+
+    def _calculate_node_bounds(self, inode: int) -> None:
+        """Calculates the bounds of the rank correlations of the edges of a node (see _edge_bounds)"""
+        node = self.nodes[inode]
+        parents = self.graph.parents[inode]
+        if len(parents) == 0:
+            return None
+
+        bounds = _edge_bounds(self.R[np.ix_(parents, parents)], [edge.cond_rank_corr for edge in node.edges])
+        for edge, edge_bounds in zip(node.edges, bounds):
+            edge.rank_corr_bounds = edge_bounds
 
-            # Variables for the looping
-            cond = []  # Vector storing the conditionalized variables
-            T = {}  # Dictionary to store temporary conditional correlations
-
-            # Loop over all parents, and calculate the correlation between the node and its parents
-            for edge in self.nodes[si].edges:
-                pi = names.index(edge.parent)
-                rpc = edge.cond_rank_corr
-
-                # Get the (conditional) rank-correlation to the parent
-                # First, assume the (conditional) rank-correlation is 1.0, to get the bounds
-                s_lower = -1.0
-                s_upper = 1.0
-                # Get the conditional correlation r1,2;conditions
-                # Loop over all conditioning nodes in reverse order, to calculate the unconditional correlation r1,2
-                for k in reversed(range(len(cond))):
-
-                    # Recursivelly calculating the correlation between nodes accounting for the conditional/partial correlation
-                    r1 = self.calculate_partial_correlation(i=pi, j=cond[k], cond=cond[:k], store=False)
-
-                    # Based on the conditional/partial correlation, calculating the resulting correlation coefficient
-                    # (all the properties of the correlation matrix are guaranteed)
-                    p1 = np.sqrt((1 - T[(si, cond[k])] ** 2) * (1 - (r1) ** 2))
-                    p2 = T[(si, cond[k])] * r1
-                    shat_lower = s_lower * p1 + p2
-                    s_lower = shat_lower
-
-                    shat_upper = s_upper * p1 + p2
-                    s_upper = shat_upper
-
-                if len(cond) == 0:
-                    edge.rank_corr_bounds = (-1.0, 1.0)
-                    edge.rank_corr = pearsontorank(self.R[si, pi])
-                    edge.string = corr_string(r=None, i=pi, j=si, offset=1)
-                else:
-                    edge.rank_corr_bounds = (
-                        pearsontorank(shat_lower),
-                        pearsontorank(shat_upper),
-                    )
-                    edge.rank_corr = pearsontorank(self.R[si, pi])
-                    edge.string = corr_string(r=None, i=pi, j=si, cond=sorted(cond), offset=1)
-
-                # Second, set the actual (conditional) rank correlation, to calculate the others
-                T[(si, pi)] = ranktopearson(rpc)
-                # No need to do any further calculations
-
-                cond.append(pi)
-
-        # Calculate rank correlations again
-        self.R = pearsontorank(self.R)
+    def get_correlation_bounds(self, parent: str, child: str) -> Tuple[float, float]:
+        """Bounds of the (non-conditional) rank correlation of an edge, given the conditional
+        rank correlations of the other edges. Calculated on the first request after a change.
+
+        Parameters
+        ----------
+        parent : str
+            Parent node name
+        child : str
+            Child node name
+
+        Returns
+        -------
+        Tuple[float, float]
+            Lower and upper bound
+        """
+        with _bounds_lock:
+            inode = self.graph.index[child]
+            if child in self._stale_bounds:
+                self._calculate_node_bounds(inode)
+                self._stale_bounds.discard(child)
+
+            return self.nodes[inode].get_edge_by_parent(parent).rank_corr_bounds
+
+    def update_correlation_bounds(self, children: List[str] = None) -> None:
+        """Calculates the stale bounds of the edges of the given nodes. To calculate them in a
+        background thread, use bounds_snapshot instead.
+
+        Parameters
+        ----------
+        children : List[str], optional
+            Child node names. If None, all stale bounds are calculated. By default None
+        """
+        with _bounds_lock:
+            stale = self._stale_bounds if children is None else self._stale_bounds.intersection(children)
+            index = self.graph.index
+            for name in list(stale):
+                if name in index:
+                    self._calculate_node_bounds(index[name])
+                self._stale_bounds.discard(name)
+
+    def bounds_snapshot(self, children: List[str] = None) -> Dict:
+        """Copy the inputs of the stale bounds of the given nodes: the correlations among their
+        parents and the conditional correlations of their edges. The bounds can then be calculated
+        in a background thread with calculate_bounds_snapshot, and stored with apply_correlation_bounds.
+
+        Parameters
+        ----------
+        children : List[str], optional
+            Child node names. If None, all nodes with stale bounds are included. By default None
+
+        Returns
+        -------
+        Dict
+            Snapshot with the inputs per node under "nodes", and the correlation matrix it was taken from under "R"
+        """
+        with _bounds_lock:
+            stale = self._stale_bounds if children is None else self._stale_bounds.intersection(children)
+            graph = self.graph
+
+            nodes = {}
+            for name in stale:
+                if name in graph.index:
+                    inode = graph.index[name]
+                    parents = graph.parents[inode]
+                    if len(parents) > 0:
+                        cond_rank_corrs = [edge.cond_rank_corr for edge in self.nodes[inode].edges]
+                        nodes[name] = (self.R[np.ix_(parents, parents)].copy(), cond_rank_corrs)
+
+            return {"R": self.R, "nodes": nodes}
+
+    def apply_correlation_bounds(self, result: Dict) -> None:
+        """Store bounds calculated from a snapshot (see bounds_snapshot). Bounds of nodes that
+        changed since the snapshot are ignored, and are calculated again on the next request.
+
+        Parameters
+        ----------
+        result : Dict
+            Result of calculate_bounds_snapshot
+        """
+        with _bounds_lock:
+            # R is replaced, not modified, when the correlations change
+            if result["R"] is not self.R:
+                return None
+
+            index = self.graph.index
+            for name, bounds in result["bounds"].items():
+                if name not in index or name not in self._stale_bounds:
+                    continue
+                node = self.nodes[index[name]]
+                if [edge.cond_rank_corr for edge in node.edges] != result["nodes"][name][1]:
+                    continue
+
+                for edge, edge_bounds in zip(node.edges, bounds):
+                    edge.rank_corr_bounds = edge_bounds
+                self._stale_bounds.discard(name)
 
     def calculate_conditional_correlation(self, parent: str, child: str, observed: float) -> float:
         """Calculates conditional correlation give the rank correlation.
@@ -747,64 +922,65 @@ class BayesianNetwork(BaseModel):
             Conditional rank correlation
         """
 
-        names = self._node_names
-
-        # Convert to correlation matrix to pearson, for calculating the partial correlations
-        self.R = ranktopearson(self.R)
-
-        si = self._node_names.index(child)
-        node = self.nodes[si]
+        graph = self.graph
 
-        # Variables for the looping
-        cond = []  # Vector storing the conditionalized variables
-        T = {}  # Dictionary to store temporary conditional correlations
+        inode = graph.index[child]
+        node = self.nodes[inode]
+        t = node.parent_index(parent)
+        parents = graph.parents[inode][: t + 1]
+
+        # Cholesky factor given the conditional correlations of the previous parents
+        R = ranktopearson(self.R[np.ix_(parents, parents)])
+        L, ell, remaining = _parent_factor(R, [edge.cond_rank_corr for edge in node.edges[:t]] + [0.0])
+
+        # Reverse the calculation, from a known observed correlation to a conditional correlation.
+        # If the correlation is fully determined by the previous parents, any value is valid.
+        scale = L[t, t] * np.sqrt(remaining[t])
+        if scale < 1e-12:
+            return 0.0
+        s = (ranktopearson(observed) - L[t, :t] @ ell[:t]) / scale
+        return pearsontorank(max(min(s, 1.0), -1.0))
+
+    def _get_factorization(self) -> Dict:
+        """Pearson form of R and its Cholesky factor, calculated once per correlation matrix.
+        R is replaced (not modified in place) when it is recalculated, which invalidates them."""
+        if self._factorization is None or self._factorization["R"] is not self.R:
+            pearson = ranktopearson(self.R)
+            try:
+                factor = np.linalg.cholesky(pearson)
+                positive_definite = True
+            except np.linalg.LinAlgError:
+                factor = covariance_factor(pearson)
+                positive_definite = False
+
+            self._factorization = {
+                "R": self.R,
+                "pearson": pearson,
+                "factor": factor,
+                "positive_definite": positive_definite,
+                "engine": None,
+            }
+
+        return self._factorization
 
-        # Loop over all parents, and calculate the correlation between the node and its parents
-        for edge in node.edges:
+    @property
+    def correlation_factor(self) -> np.ndarray:
+        """Cholesky factor of the Pearson form of R, such that L @ L.T = R (Pearson). If R is not
+        positive definite, a factor from the eigendecomposition is returned."""
+        return self._get_factorization()["factor"]
 
-            pi = names.index(edge.parent)
-            rpc = edge.cond_rank_corr
-
-            # Get the (conditional) rank-correlation to the parent
-            # First, assume the (conditional) rank-correlation is 1.0, to get the bounds
-            T[(si, pi)] = ranktopearson(rpc)
-            # Get the conditional correlation r1,2;conditions
-            if edge.parent != parent:
-                s = T[(si, pi)]
-                # Loop over all conditioning nodes in reverse order, to calculate the unconditional correlation r1,2
-                for k in reversed(range(len(cond))):
-                    # Recursivelly calculating the correlation between nodes accounting for the conditional/partial correlation
-                    r1 = self.calculate_partial_correlation(i=pi, j=cond[k], cond=cond[:k], store=False)
-                    # Based on the conditional/partial correlation, calculating the resulting correlation coefficient
-                    # (all the properties of the correlation matrix are guaranteed)
-                    shat = s * np.sqrt((1 - T[(si, cond[k])] ** 2) * (1 - (r1) ** 2)) + T[(si, cond[k])] * r1
-                    s = shat
-
-            # If we reach the requested parent, we reverse the calculation, from a
-            # known observed correlation to a conditional correlation
-            else:
-                s = ranktopearson(observed)
-                for k in range(len(cond)):
-
-                    # Recursivelly calculating the correlation between nodes accounting for the conditional/partial correlation
-                    r1 = self.calculate_partial_correlation(i=pi, j=cond[k], cond=cond[:k], store=False)
-                    # Based on the conditional/partial correlation, calculating the resulting correlation coefficient
-                    # (all the properties of the correlation matrix are guaranteed)
-                    shat = (s - T[(si, cond[k])] * r1) / np.sqrt((1 - T[(si, cond[k])] ** 2) * (1 - (r1) ** 2))
-                    s = shat
-
-                break
-
-            cond.append(pi)
-
-        # Calculate rank correlations again
-        self.R = pearsontorank(self.R)
-
-        return pearsontorank(s)
+    @property
+    def conditioning_engine(self) -> ConditioningEngine:
+        """Conditioning engine for the current correlation matrix"""
+        factorization = self._get_factorization()
+        if factorization["engine"] is None:
+            factorization["engine"] = ConditioningEngine(factorization["pearson"], factor=factorization["factor"])
+        return factorization["engine"]
 
     @property
     def is_invertible(self) -> bool:
-        """Whether the correlation matrix is invertible (needed to be a valid correlation matrix)
+        """Whether the correlation matrix is invertible (needed to be a valid correlation matrix).
+        Checked with the (cached) Cholesky decomposition, which exists if R is positive definite.
 
         Returns
         -------
@@ -813,24 +989,25 @@ class BayesianNetwork(BaseModel):
         """
         if self.R.size == 0:
             return True
-        return self.R.shape[0] == self.R.shape[1] and np.linalg.matrix_rank(self.R) == self.R.shape[0]
+        return self.R.shape[0] == self.R.shape[1] and self._get_factorization()["positive_definite"]
 
     def to_json(self, path: Path) -> None:
-        """Write the BN configuration to JSON
+        """Write the BN configuration to JSON. The bounds that were not calculated since the
+        last change are calculated first, so no outdated or missing bounds are saved.
 
         Parameters
         ----------
         path : Path
             Destination path
         """
+        self.update_correlation_bounds()
         with path.open("w") as f:
-            f.write(self.model_dump_json(indent=4, exclude={"R", "partcorrs", "edgelist"}))
+            f.write(self.model_dump_json(indent=4, exclude={"R", "edgelist"}))
 
-    def calculate_partial_correlation(self, i: int, j: int, cond: List[int], store: bool = True) -> float:
+    def calculate_partial_correlation(self, i: int, j: int, cond: List[int]) -> float:
         """
-        Calculates the partial correlation with a recursive approach
-        and returns both the partial correlations r and a list L containing
-        information about the partial correlations during the recursive calculation
+        Calculates the (Pearson) partial correlation of two nodes given the conditioning
+        nodes, from the Schur complement of the correlation matrix
 
         Parameters
         ----------
@@ -840,55 +1017,70 @@ class BayesianNetwork(BaseModel):
             column index R to calculate the correlation
         cond : list
             conditioning variable(s)
-        store : bool
-            whether to save the calculated correlation or not (in that case, overwrite)
 
         Returns
         -------
         r : float
             partial correlation r
         """
+        R = ranktopearson(self.R[np.ix_([i, j] + list(cond), [i, j] + list(cond))])
 
-        # Defining the number of conditioning variables
-        n = len(cond)
-
-        # If the conditioning variable vector is empty, then the value is
-        # obtained from the correlation matrix
-        if n == 0:
-            r = self.R[i, j]
-            return r
+        # Conditional covariance of i and j
+        S = R[:2, :2]
+        if len(cond) > 0:
+            S = S - R[:2, 2:] @ np.linalg.solve(R[2:, 2:], R[2:, :2])
 
-        # Ordering of the indeces
-        if i <= j:
-            isort, jsort = i, j
-        else:
-            isort, jsort = j, i
+        r = S[0, 1] / np.sqrt(S[0, 0] * S[1, 1])
 
-        # Extracting information on the cell L (from previous calculations)
-        comb = (isort, jsort) + tuple(cond)
-
-        # If requested partial correlation is already calculated, return
-        if comb in self.partcorrs:
-            return self.partcorrs[comb]
-
-        # If not, the correlation still needs to be calculated
-        r1 = self.calculate_partial_correlation(i, j, cond[1:n])
-        r2 = self.calculate_partial_correlation(i, cond[0], cond[1:n])
-        r3 = self.calculate_partial_correlation(j, cond[0], cond[1:n])
+        # Limit r to [-1, 1]. Numerical inaccuracies can cause it to be slightly outside this range
+        return max(min(1, r), -1)
+
+    def random_streams(self) -> RandomStreams:
+        """Random streams of the network's seed. If the network has no seed yet, a new seed is
+        generated and stored, so the draws can be reproduced from the saved project."""
+        streams = RandomStreams(self.seed)
+        if self.seed is None:
+            self.seed = streams.seed
+        return streams
+
+    def iter_mvn_sample(
+        self, size: int, nodes: list = None, rng: np.random.Generator = None, chunk_size: int = 100000
+    ) -> Iterator[np.ndarray]:
+        """Draw a multivariate normal sample in chunks, with the cached Cholesky factor. Only one
+        chunk of independent normals is in memory at a time.
 
-        # Calculating partial correlation of [(i,j) | (cond(1),cond(2:n))]
-        r = (r1 - r2 * r3) / ((1 - (r2) ** 2) * (1 - (r3) ** 2)) ** (0.5)
+        Parameters
+        ----------
+        size : int
+            Sample size
+        nodes : list, optional
+            Nodes to include in sample. If None, all are included, by default None
+        rng : np.random.Generator, optional
+            Random generator to draw from. If None, the "unconditional" stream of the network's seed is
+            used (see RandomStreams), so the sample is reproducible. By default None
+        chunk_size : int, optional
+            Maximum number of samples per chunk, by default 100000
 
-        # Limit r to [-1, 1]. Numerical inaccuracies can cause it to be slightly outside this range
-        r = max(min(1, r), -1)
+        Yields
+        ------
+        np.ndarray
+            Random sample with shape (chunk size, number of nodes)
+        """
+        if rng is None:
+            rng = self.random_streams().generator("unconditional")
 
-        # Saving the results
-        if store:
-            self.partcorrs[comb] = r
+        # The rows of the factor of the selected nodes give their covariance matrix
+        factor = self.correlation_factor
+        if nodes is not None:
+            factor = factor[[self.graph.index[name] for name in nodes]]
 
-        return r
+        for start in range(0, size, chunk_size):
+            normals = rng.standard_normal((min(chunk_size, size - start), factor.shape[1]))
+            yield normals @ factor.T
 
-    def draw_mvn_sample(self, size: int, nodes: list = None) -> np.ndarray:
+    def draw_mvn_sample(
+        self, size: int, nodes: list = None, rng: np.random.Generator = None, chunk_size: int = 100000
+    ) -> np.ndarray:
         """Draw a multivariate normal sample with size for nodes. The sample
         is distributed following the multivariate normal distribution that follows from the BN.
 
@@ -898,17 +1090,114 @@ class BayesianNetwork(BaseModel):
             Sample size
         nodes : list, optional
             Nodes to include in sample. If None, all are included, by default None
+        rng : np.random.Generator, optional
+            Random generator to draw from. If None, the "unconditional" stream of the network's seed is
+            used (see RandomStreams), so the sample is reproducible. By default None
+        chunk_size : int, optional
+            Number of samples drawn at once, by default 100000
 
         Returns
         -------
         np.ndarray
             Random sample
         """
+        sample = np.empty((size, len(self.nodes) if nodes is None else len(nodes)))
+
+        start = 0
+        for chunk in self.iter_mvn_sample(size, nodes=nodes, rng=rng, chunk_size=chunk_size):
+            sample[start : start + len(chunk)] = chunk
+            start += len(chunk)
+
+        return sample
+
+    def _conditional_latent(self, name: str, evidence: Dict[str, float], size: str) -> Tuple[float, float]:
+        """Conditional mean and standard deviation of the latent standard normal of a node"""
+        from core import sampler
+
+        index = self.graph.index
+        evidence = {} if evidence is None else evidence
+
+        if self.R.shape != (len(index), len(index)):
+            raise ValueError("The correlation matrix is not calculated for the current nodes.")
+        for key in evidence:
+            if key not in index:
+                raise KeyError(f'Node "{key}" not in network.')
+        if name in evidence:
+            raise ValueError(f'Node "{name}" is conditioned.')
+
+        condition_nodes = sorted(index[key] for key in evidence)
+        normal_values = [
+            sampler.to_normal(self.nodes[i].distribution, self.nodes[i].scipy_parameters(size), evidence[self.nodes[i].name])
+            for i in condition_nodes
+        ]
+
+        operator = self.conditioning_engine.operator(condition_nodes)
+        k = operator.remaining_nodes.index(index[name])
+        return operator.mean(normal_values)[k], operator.std[k]
+
+    def conditional_percentiles(
+        self, name: str, percentiles: Union[List[float], np.ndarray], evidence: Dict[str, float] = None, size: str = "large"
+    ) -> np.ndarray:
+        """Exact percentiles of a node given the evidence, without sampling. For the Gaussian
+        copula, the conditional quantile is F^-1(Phi(mu + sigma * z_p)), with mu and sigma the
+        conditional mean and standard deviation of the latent normal.
 
-        cov = ranktopearson(self.R)
-        if nodes is None:
-            return np.random.multivariate_normal(mean=np.zeros(len(self.nodes)), cov=cov, size=size)
-        else:
-            names = self._node_names
-            order = [names.index(name) for name in nodes]
-            return np.random.multivariate_normal(mean=np.zeros(len(nodes)), cov=cov[np.ix_(order, order)], size=size)
\ No newline at end of file
+        Parameters
+        ----------
+        name : str
+            Node name
+        percentiles : Union[List[float], np.ndarray]
+            Percentiles (0-100)
+        evidence : Dict[str, float], optional
+            Conditioning values per node name. If None, the unconditional percentiles are returned. By default None
+        size : str, optional
+            Parameter set of the nodes, "small" (aircraft codes A-C) or "large", by default "large"
+
+        Returns
+        -------
+        np.ndarray
+            Values at the percentiles
+        """
+        from scipy.special import ndtri
+
+        from core import sampler
+
+        mu, sigma = self._conditional_latent(name, evidence, size)
+        node = self._get_node_by_name(name)
+        z = mu + sigma * ndtri(np.asarray(percentiles, dtype=float) / 100)
+        return sampler.from_normal(node.distribution, node.scipy_parameters(size), z)
+
+    def conditional_median(self, name: str, evidence: Dict[str, float] = None, size: str = "large") -> float:
+        """Exact median of a node given the evidence. See BayesianNetwork.conditional_percentiles"""
+        return float(self.conditional_percentiles(name, [50], evidence=evidence, size=size)[0])
+
+    def exceedance_probability(
+        self, name: str, values: Union[List[float], np.ndarray], evidence: Dict[str, float] = None, size: str = "large"
+    ) -> np.ndarray:
+        """Exact probability that a node exceeds the values, given the evidence
+
+        Parameters
+        ----------
+        name : str
+            Node name
+        values : Union[List[float], np.ndarray]
+            Values to exceed
+        evidence : Dict[str, float], optional
+            Conditioning values per node name. If None, the unconditional probabilities are returned. By default None
+        size : str, optional
+            Parameter set of the nodes, "small" (aircraft codes A-C) or "large", by default "large"
+
+        Returns
+        -------
+        np.ndarray
+            Exceedance probabilities
+        """
+        from scipy.special import ndtr
+
+        from core import sampler
+
+        mu, sigma = self._conditional_latent(name, evidence, size)
+        node = self._get_node_by_name(name)
+        z = sampler.to_normal(node.distribution, node.scipy_parameters(size), np.asarray(values, dtype=float))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return ndtr((mu - z) / sigma)
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceCache:
+    """Cache for inference results (conditional samples), with a memory limit. When the
+    limit is exceeded, the least recently used results are removed first.
+
+    Parameters
+    ----------
+    max_bytes : int, optional
+        Memory limit of the cached arrays, by default 512 MB
+    """
+
+    def __init__(self, max_bytes: int = 512 * 2**20) -> None:
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        # Estimates run on worker threads, while dialogs use the cache from the GUI thread
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def make_key(
+        R: np.ndarray,
+        distributions: List[str],
+        parameters: List[List[float]],
+        nodes: List[int],
+        values: List[float],
+        n: int,
+        seed: Union[int, None],
+        chunk: int = 0,
+        sampling: str = "mc",
+        quantile_tables: bool = False,
+    ) -> str:
+        """Create a key from everything that determines the inference result
+
+        Parameters
+        ----------
+        R : np.ndarray
+            Rank correlation matrix
+        distributions : List[str]
+            Distribution names of the nodes
+        parameters : List[List[float]]
+            Distribution parameters of the nodes
+        nodes : List[int]
+            Indices of the conditioned nodes
+        values : List[float]
+            Conditioning values
+        n : int
+            Sample size
+        seed : Union[int, None]
+            Random seed
+        chunk : int, optional
+            Chunk number of the random stream, by default 0
+        sampling : str, optional
+            Sampling method, by default "mc"
+        quantile_tables : bool, optional
+            Whether the marginals were transformed with quantile tables, by default False
+
+        Returns
+        -------
+        str
+            Hash of the inputs
+        """
+        h = hashlib.sha1()
+        h.update(np.ascontiguousarray(R, dtype=np.float64).tobytes())
+        h.update(repr((distributions, [list(map(float, p)) for p in parameters])).encode())
+        h.update(repr((list(nodes), [float(v) for v in values], int(n), seed, int(chunk), sampling, bool(quantile_tables))).encode())
+        return h.hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Union[np.ndarray, None]:
+        """Get a cached result and mark it as most recently used. Returns None if not present."""
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key: str, F: np.ndarray) -> None:
+        """Add a result to the cache. The array is made read-only, as it is shared by all users."""
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key).nbytes
+
+            # Results that do not fit at all are not stored
+            if F.nbytes > self.max_bytes:
+                return
+
+            F.flags.writeable = False
+            self._entries[key] = F
+            self.nbytes += F.nbytes
+            self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used results until the cache fits within the memory limit"""
+        with self._lock:
+            while self.nbytes > self.max_bytes and len(self._entries) > 0:
+                _, F = self._entries.popitem(last=False)
+                self.nbytes -= F.nbytes
+                logger.debug(f"Removed inference result of {F.nbytes / 2**20:.1f} MB from cache.")
+
+    def set_max_bytes(self, max_bytes: int) -> None:
+        """Change the memory limit, and remove results if needed"""
+        self.max_bytes = max_bytes
+        self.evict()
+
+    def clear(self) -> None:
+        """Remove all cached results"""
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+
+# Cache shared by all estimates in the application
+inference_cache = InferenceCache()
@@ -0,0 +1,195 @@
+import argparse
+import logging
+import time
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from core.bn import BayesianNetwork
+from core.finance import ConstructionSchedule
+from core.mcm import MCM, MissingConditionError, conditions_from_bn
+from core.rng import RandomStreams
+
+logger = logging.getLogger(__name__)
+
+
+def estimate(
+    project: Path,
+    n: int,
+    out: Path,
+    percentiles: List[float],
+    seed: int = None,
+    tolerance: float = None,
+    batch_size: int = 10000,
+    time_budget: float = None,
+    sampling: str = "mc",
+    dtype: str = "float64",
+    check_correlations: bool = False,
+    quantile_tables: bool = False,
+    schedule: Path = None,
+    exceedance: List[float] = None,
+) -> None:
+    """Run a cost estimate for a saved project and write the results to a npz-file
+
+    Parameters
+    ----------
+    project : Path
+        Project file (json)
+    n : int
+        Sample size, or maximum sample size with a tolerance
+    out : Path
+        Destination file (npz)
+    percentiles : List[float]
+        Percentiles of the estimate to write
+    seed : int, optional
+        Random seed. If None, the seed stored in the project is used, by default None
+    tolerance : float, optional
+        Relative tolerance of the percentiles for adaptive sampling. If None, n samples are drawn. By default None
+    batch_size : int, optional
+        Batch size for adaptive sampling, by default 10000
+    time_budget : float, optional
+        Time budget (seconds) for adaptive sampling, by default None
+    sampling : str, optional
+        Sampling method: "mc", "lhs" or "sobol", by default "mc"
+    dtype : str, optional
+        Data type of the results: "float64" or "float32", by default "float64"
+    check_correlations : bool, optional
+        Compare the correlation matrix with py_banshee's, by default False
+    quantile_tables : bool, optional
+        Transform the marginals with interpolated quantile tables, by default False
+    schedule : Path, optional
+        Construction schedule (json, see ConstructionSchedule). If given, the nominal and present
+        value capex are written as well. By default None
+    exceedance : List[float], optional
+        Costs for which the probability that the estimate exceeds them is written, by default None
+    """
+    t0 = time.perf_counter()
+    bn = BayesianNetwork.parse_file(project)
+    bn.calculate_correlation_matrix()
+    conditions = conditions_from_bn(bn)
+    logger.info(f'Project "{project}" loaded in {time.perf_counter() - t0:.3f} s.')
+
+    mcm = MCM(
+        bn,
+        conditions,
+        n=n,
+        seed=seed,
+        tolerance=tolerance,
+        percentiles=percentiles,
+        batch_size=batch_size,
+        time_budget=time_budget,
+        sampling=sampling,
+        dtype=np.dtype(dtype),
+        check_correlations=check_correlations,
+        quantile_tables=quantile_tables,
+        schedule=ConstructionSchedule.parse_file(schedule) if schedule is not None else None,
+    )
+    result = mcm.run()
+    logger.info(
+        f"Simulated {result.n:,} samples (seed {result.seed}, {result.nbytes / 2**20:.1f} MB) "
+        f"in {time.perf_counter() - t0:.3f} s."
+    )
+    if not result.converged:
+        logger.warning("The percentiles did not converge to the requested tolerance.")
+
+    data = {
+        "seed": np.asarray(str(result.seed)),
+        "converged": np.asarray(result.converged),
+        "percentiles": np.asarray(percentiles, dtype=float),
+    }
+    ecdf = result.sim_data.ecdf("Simulation")
+    data["estimate_percentiles"] = ecdf.percentile(percentiles)
+    if exceedance is not None:
+        data["exceedance_values"] = np.asarray(exceedance, dtype=float)
+        data["exceedance_probabilities"] = ecdf.exceedance(exceedance)
+    for key, values in result.sim_data.items():
+        data[key.replace(" ", "_")] = values
+    for key, values in result.simulated_cost.items():
+        data["cost_" + key.replace(" ", "_")] = values
+    if result.phased_capex is not None:
+        data["capex_by_year"] = result.phased_capex
+
+    np.savez(out, **data)
+    logger.info(f'Results written to "{out}".')
+
+
+def main(argv: List[str]) -> int:
+    """Command line entry point for batch runs, which does not import the user interface
+
+    Parameters
+    ----------
+    argv : List[str]
+        Command line arguments, without the program name
+
+    Returns
+    -------
+    int
+        Exit code
+    """
+    parser = argparse.ArgumentParser(prog="DAiCE", description="Dynamic Airfield Cost Estimator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    estimate_parser = subparsers.add_parser("estimate", help="Estimate the cost of a saved project")
+    estimate_parser.add_argument("project", type=Path, help="Project file (json)")
+    estimate_parser.add_argument("--n", type=float, default=100000, help="Sample size, e.g. 1e6")
+    estimate_parser.add_argument("--out", type=Path, default=Path("results.npz"), help="Output file (npz)")
+    estimate_parser.add_argument(
+        "--tolerance", type=float, default=None, help="Relative tolerance of the percentiles, enables adaptive sampling"
+    )
+    estimate_parser.add_argument("--batch-size", type=int, default=10000, help="Batch size for adaptive sampling")
+    estimate_parser.add_argument("--time-budget", type=float, default=None, help="Time budget (s) for adaptive sampling")
+    estimate_parser.add_argument(
+        "--sampling", choices=RandomStreams.methods, default="mc", help="Sampling method (Monte Carlo, Latin hypercube, Sobol')"
+    )
+    estimate_parser.add_argument(
+        "--dtype", choices=["float64", "float32"], default="float64", help="Data type of the results"
+    )
+    estimate_parser.add_argument(
+        "--check-correlations", action="store_true", help="Validate the correlation matrix against py_banshee"
+    )
+    estimate_parser.add_argument(
+        "--quantile-tables", action="store_true", help="Transform the marginals with interpolated quantile tables"
+    )
+    estimate_parser.add_argument(
+        "--schedule", type=Path, default=None, help="Construction schedule (json) with phasing and price escalation"
+    )
+    estimate_parser.add_argument(
+        "--exceedance", type=float, nargs="+", default=None, help="Costs to report the exceedance probability of"
+    )
+    estimate_parser.add_argument("--seed", type=int, default=None, help="Random seed, overrides the project seed")
+    estimate_parser.add_argument(
+        "--percentiles", type=float, nargs="+", default=[10, 50, 90], help="Percentiles to report"
+    )
+
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        format="%(asctime)s.%(msecs)03d %(levelname)s: %(message)s (%(name)s)",
+        datefmt="%H:%M:%S",
+        level=logging.INFO,
+    )
+
+    if args.command == "estimate":
+        try:
+            estimate(
+                project=args.project,
+                n=int(args.n),
+                out=args.out,
+                percentiles=args.percentiles,
+                seed=args.seed,
+                tolerance=args.tolerance,
+                batch_size=args.batch_size,
+                time_budget=args.time_budget,
+                sampling=args.sampling,
+                dtype=args.dtype,
+                check_correlations=args.check_correlations,
+                quantile_tables=args.quantile_tables,
+                schedule=args.schedule,
+                exceedance=args.exceedance,
+            )
+        except MissingConditionError as error:
+            logger.error(error)
+            return 1
+
+    return 0
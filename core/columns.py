@@ -0,0 +1,185 @@
+from collections.abc import Mapping
+from typing import Iterator, List, Union
+
+import numpy as np
+
+
+class ECDF:
+    """Empirical distribution of a sample, from its sorted values. Quantiles are looked up by
+    position (O(1) per quantile) and exceedance probabilities by binary search (O(log n)), so
+    after sorting once, queries do not depend on the sample size. NaN values are ignored.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Sample
+    presorted : bool, optional
+        Whether the values are already sorted in ascending order (without NaN), e.g. quantiles
+        at increasing probabilities. By default False
+    """
+
+    def __init__(self, values: np.ndarray, presorted: bool = False) -> None:
+        values = np.ravel(values)
+        if not presorted:
+            values = np.sort(values)
+            # NaN values are sorted to the end
+            if values.dtype.kind == "f" and len(values) > 0 and np.isnan(values[-1]):
+                values = values[: np.searchsorted(values, np.nan, side="left")]
+        self.sorted = values
+
+    def __len__(self) -> int:
+        return len(self.sorted)
+
+    def quantile(self, q: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """Quantiles with linear interpolation between the order statistics, equal to np.quantile
+
+        Parameters
+        ----------
+        q : Union[float, np.ndarray]
+            Probabilities (0-1)
+
+        Returns
+        -------
+        Union[float, np.ndarray]
+            Quantiles with the shape of q. NaN for an empty sample.
+        """
+        q = np.asarray(q, dtype=np.float64)
+        n = len(self.sorted)
+        if n == 0:
+            return np.full(q.shape, np.nan)[()]
+
+        position = np.clip(q, 0, 1) * (n - 1)
+        lower = np.floor(position).astype(np.intp)
+        upper = np.minimum(lower + 1, n - 1)
+        fraction = position - lower
+
+        below = self.sorted[lower].astype(np.float64)
+        above = self.sorted[upper].astype(np.float64)
+        # Without the fraction, infinite values would give inf - inf
+        with np.errstate(invalid="ignore"):
+            return np.where(fraction > 0, below + fraction * (above - below), below)[()]
+
+    def percentile(self, p: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """Percentiles (0-100), see ECDF.quantile"""
+        return self.quantile(np.asarray(p, dtype=np.float64) / 100)
+
+    def cdf(self, x: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """Fraction of the sample at or below x"""
+        if len(self.sorted) == 0:
+            return np.full(np.shape(x), np.nan)[()]
+        return np.searchsorted(self.sorted, x, side="right") / len(self.sorted)
+
+    def exceedance(self, x: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+        """Fraction of the sample above x"""
+        return 1 - self.cdf(x)
+
+
+class Columns(Mapping):
+    """Columnar store for simulation results. Every column is either a contiguous array
+    with one value per sample, or a scalar (e.g. a conditioned design variable) that is
+    broadcast to the number of samples when read, without allocating memory.
+
+    Columns behave as a read-only dictionary of arrays, so they can be used wherever the
+    simulation results were dictionaries. Columns are added or replaced by assignment. The
+    empirical distribution of a column (see ECDF) is created on first use and kept until the
+    column is replaced.
+
+    Parameters
+    ----------
+    n : int, optional
+        Number of samples. If None, it is taken from the first array that is added. By default None
+    dtype : np.dtype, optional
+        Data type of the stored values, by default np.float64
+    columns : dict, optional
+        Initial columns, by default None
+    """
+
+    def __init__(self, n: int = None, dtype: np.dtype = np.float64, columns: dict = None) -> None:
+        self.n = n
+        self.dtype = np.dtype(dtype)
+        self._columns = {}
+        self._ecdfs = {}
+
+        if columns is not None:
+            for name, values in columns.items():
+                self[name] = values
+
+    def __setitem__(self, name: str, values: Union[np.ndarray, float]) -> None:
+        self._ecdfs.pop(name, None)
+        if np.ndim(values) == 0:
+            self._columns[name] = self.dtype.type(values)
+            return
+
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        if values.ndim != 1:
+            raise ValueError(f'Column "{name}" must be one-dimensional, got shape {values.shape}.')
+        if self.n is None:
+            self.n = len(values)
+        elif len(values) != self.n:
+            raise ValueError(f'Column "{name}" has {len(values)} values, expected {self.n}.')
+
+        self._columns[name] = values
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        values = self._columns[name]
+        if self.is_scalar(name):
+            # Read-only view with stride 0
+            return np.broadcast_to(values, (self.n or 0,))
+        return values
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._columns)
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    def __repr__(self) -> str:
+        return f"Columns(n={self.n}, dtype={self.dtype}, columns=[{', '.join(self._columns)}], nbytes={self.nbytes:,})"
+
+    def is_scalar(self, name: str) -> bool:
+        """Whether the column is stored as a single value"""
+        return np.ndim(self._columns[name]) == 0
+
+    def raw(self, name: str) -> Union[np.ndarray, float]:
+        """Stored values of a column, i.e. the array or the scalar without broadcasting.
+        Use this in calculations, as numpy broadcasts the scalars more efficiently."""
+        return self._columns[name]
+
+    def ecdf(self, name: str) -> ECDF:
+        """Empirical distribution of a column, sorted on first use and shared by all users of
+        the column (graphs, dialogs and exports)"""
+        if name not in self._ecdfs:
+            self._ecdfs[name] = ECDF(np.atleast_1d(self.raw(name)))
+        return self._ecdfs[name]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory footprint (bytes) of the stored values"""
+        return sum(values.nbytes for values in self._columns.values())
+
+    @classmethod
+    def concatenate(cls, parts: List["Columns"]) -> "Columns":
+        """Join the samples of several stores with the same columns. Scalar columns that are
+        equal in all parts remain scalars.
+
+        Parameters
+        ----------
+        parts : List[Columns]
+            Stores to join
+
+        Returns
+        -------
+        Columns
+            Joined store
+        """
+        first = parts[0]
+        joined = cls(n=sum(part.n for part in parts), dtype=first.dtype)
+
+        for name in first:
+            values = [part.raw(name) for part in parts]
+            if all(part.is_scalar(name) for part in parts) and all(value == values[0] for value in values):
+                joined[name] = values[0]
+            else:
+                joined[name] = np.concatenate([part[name] for part in parts])
+
+        return joined
@@ -0,0 +1,149 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+
+def covariance_factor(S: np.ndarray) -> np.ndarray:
+    """Factor A of a covariance matrix, such that A @ A.T = S. Uses the Cholesky
+    decomposition, or the eigendecomposition if S is only positive semi-definite."""
+    try:
+        return np.linalg.cholesky(S)
+    except np.linalg.LinAlgError:
+        w, V = np.linalg.eigh(S)
+        return V * np.sqrt(np.clip(w, 0, None))
+
+
+class ConditionalOperator:
+    """Conditional distribution of the latent standard normals, given a set of conditioned
+    nodes. The regression coefficients and the conditional covariance (Schur complement)
+    only depend on which nodes are conditioned, so they are computed once. Conditioning
+    on new values is then a matrix-vector product.
+
+    Parameters
+    ----------
+    R : np.ndarray
+        Correlation matrix (Pearson) of the latent standard normals
+    condition_nodes : Tuple[int]
+        Indices of the conditioned nodes
+    factor : np.ndarray, optional
+        Factor of R (e.g. the Cholesky factor), used when no nodes are conditioned. By default None
+    """
+
+    def __init__(self, R: np.ndarray, condition_nodes: Tuple[int], factor: np.ndarray = None) -> None:
+        self.condition_nodes = list(condition_nodes)
+        self.remaining_nodes = [i for i in range(len(R)) if i not in self.condition_nodes]
+
+        R_cc = R[np.ix_(self.condition_nodes, self.condition_nodes)]
+        R_rc = R[np.ix_(self.remaining_nodes, self.condition_nodes)]
+        R_rr = R[np.ix_(self.remaining_nodes, self.remaining_nodes)]
+
+        # Regression coefficients B = R_rc R_cc^-1 and the Schur complement R_rr - B R_cr,
+        # symmetrized to remove numerical errors
+        self.B = np.linalg.solve(R_cc, R_rc.T).T if len(self.condition_nodes) > 0 else np.zeros((len(R_rr), 0))
+        S = R_rr - self.B @ R_rc.T
+        self.S = (S + S.T) / 2
+        if len(self.condition_nodes) == 0 and factor is not None:
+            self.L = factor
+        else:
+            self.L = covariance_factor(self.S)
+        self.std = np.sqrt(np.clip(np.diag(self.S), 0, None))
+
+    def mean(self, normal_values: np.ndarray) -> np.ndarray:
+        """Conditional mean of the remaining nodes, for conditioning values in standard normal space"""
+        return self.B @ np.asarray(normal_values, dtype=float)
+
+    def residuals(self, normals: np.ndarray) -> np.ndarray:
+        """Correlate independent standard normals with shape (size, remaining nodes) into
+        conditional residuals, which do not depend on the conditioning values"""
+        return normals @ self.L.T
+
+    def sample(self, normal_values: np.ndarray, normals: np.ndarray) -> np.ndarray:
+        """Conditional samples of the remaining nodes in standard normal space
+
+        Parameters
+        ----------
+        normal_values : np.ndarray
+            Conditioning values in standard normal space
+        normals : np.ndarray
+            Independent standard normals with shape (size, remaining nodes)
+
+        Returns
+        -------
+        np.ndarray
+            Samples with shape (size, remaining nodes)
+        """
+        return self.mean(normal_values) + self.residuals(normals)
+
+
+class ConditioningEngine:
+    """Gaussian-copula inference for a correlation matrix. The conditional operators are
+    cached per set of conditioned nodes, so edits that only change conditioning values
+    do not refactorize the matrix.
+
+    Parameters
+    ----------
+    R : np.ndarray
+        Correlation matrix (Pearson) of the latent standard normals
+    factor : np.ndarray, optional
+        Factor of R (e.g. the Cholesky factor), if already known. By default None
+    """
+
+    def __init__(self, R: np.ndarray, factor: np.ndarray = None) -> None:
+        self.R = np.array(R, dtype=float)
+        self.factor = factor
+        self._operators: Dict[Tuple[int], ConditionalOperator] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # The lock cannot be copied or pickled
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def operator(self, condition_nodes: List[int]) -> ConditionalOperator:
+        """Conditional operator for a set of conditioned nodes, computed on first use"""
+        key = tuple(condition_nodes)
+        with self._lock:
+            if key not in self._operators:
+                self._operators[key] = ConditionalOperator(self.R, key, factor=self.factor)
+            return self._operators[key]
+
+
+# Engines of the most recently used correlation matrices
+_engines = OrderedDict()
+_engines_lock = threading.Lock()
+
+
+def get_engine(R: np.ndarray, maxsize: int = 8) -> ConditioningEngine:
+    """Conditioning engine for a correlation matrix, reused while the matrix does not change
+
+    Parameters
+    ----------
+    R : np.ndarray
+        Correlation matrix (Pearson) of the latent standard normals
+    maxsize : int, optional
+        Number of engines to keep, by default 8
+
+    Returns
+    -------
+    ConditioningEngine
+        Engine for R
+    """
+    R = np.ascontiguousarray(R, dtype=np.float64)
+    key = hashlib.sha1(R.tobytes() + repr(R.shape).encode()).hexdigest()
+
+    with _engines_lock:
+        if key in _engines:
+            _engines.move_to_end(key)
+        else:
+            _engines[key] = ConditioningEngine(R)
+            while len(_engines) > maxsize:
+                _engines.popitem(last=False)
+        return _engines[key]
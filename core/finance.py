@@ -0,0 +1,458 @@
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+
+from core.columns import Columns
+from core.models import BaseModel
+
+
+def wacc(
+    gearing: float = 0.4,
+    cost_of_debt: float = 0.07,
+    tax_rate: float = 0.258,
+    risk_free_rate: float = 0.04,
+    market_risk_premium: float = 0.05,
+    equity_beta: float = 0.7,
+) -> float:
+    """Weighted average cost of capital, with the cost of equity from the CAPM
+
+    Parameters
+    ----------
+    gearing : float, optional
+        Share of debt in the capital, by default 0.4
+    cost_of_debt : float, optional
+        Cost of debt, by default 0.07
+    tax_rate : float, optional
+        Corporate tax rate, by default 0.258
+    risk_free_rate : float, optional
+        Risk-free rate, by default 0.04
+    market_risk_premium : float, optional
+        Equity market risk premium, by default 0.05
+    equity_beta : float, optional
+        Equity beta, by default 0.7
+
+    Returns
+    -------
+    float
+        WACC (fraction per year)
+    """
+    cost_of_equity = risk_free_rate + market_risk_premium * equity_beta
+    return gearing * cost_of_debt * (1 + tax_rate) + (1 - gearing) * cost_of_equity
+
+
+def base_charge(capex: np.ndarray, wacc: float, mvts_mtow: float, pax: float) -> np.ndarray:
+    """Charge per tonne MTOW for which the revenue equals the WACC on the capex, with the
+    charge per passenger twice the charge per tonne MTOW
+
+    Parameters
+    ----------
+    capex : np.ndarray
+        Simulated capital expenditure
+    wacc : float
+        Weighted average cost of capital
+    mvts_mtow : float
+        Tonnes MTOW landing per year
+    pax : float
+        Departing passengers per year
+
+    Returns
+    -------
+    np.ndarray
+        Charge per tonne MTOW, per sample
+    """
+    return wacc * np.asarray(capex, dtype=np.float64) / (mvts_mtow + 2 * pax)
+
+
+def payback_period(capex: np.ndarray, revenue: float, opex: float) -> np.ndarray:
+    """Static payback period (years) of the capex from the yearly revenue minus OPEX
+
+    Parameters
+    ----------
+    capex : np.ndarray
+        Simulated capital expenditure
+    revenue : float
+        Yearly revenue from the charges
+    opex : float
+        Yearly operational expenditure
+
+    Returns
+    -------
+    np.ndarray
+        Payback period per sample. Infinite if the revenue does not exceed the OPEX.
+    """
+    with np.errstate(divide="ignore"):
+        return np.asarray(capex, dtype=np.float64) / (revenue - opex)
+
+
+def annuity(principal: np.ndarray, rate: float, term: int) -> np.ndarray:
+    """Yearly payment that repays a loan with interest in equal instalments
+
+    Parameters
+    ----------
+    principal : np.ndarray
+        Loan amount
+    rate : float
+        Interest rate (fraction per year)
+    term : int
+        Number of yearly payments
+
+    Returns
+    -------
+    np.ndarray
+        Yearly payment, with the shape of principal
+    """
+    principal = np.asarray(principal, dtype=np.float64)
+    if term <= 0:
+        return np.zeros_like(principal)
+    if rate == 0:
+        return principal / term
+    return principal * rate / (1 - (1 + rate) ** -term)
+
+
+def cash_flows(
+    capex: np.ndarray,
+    landing_revenue: Union[float, np.ndarray],
+    passenger_revenue: Union[float, np.ndarray],
+    opex: float,
+    years: int = 40,
+    mvts_growth: float = 0.0,
+    pax_growth: float = 0.0,
+    opex_growth: float = 0.0,
+    debt_share: float = 0.0,
+    interest_rate: float = 0.07,
+    loan_term: int = 20,
+) -> np.ndarray:
+    """Yearly cash flows per sample. Year 0 holds the capex (the equity share if part of it is
+    financed with debt), years 1 to years the revenue minus the OPEX and the loan payments.
+    The revenues grow with the traffic (movements and passengers).
+
+    Parameters
+    ----------
+    capex : np.ndarray
+        Simulated capital expenditure, shape (samples,)
+    landing_revenue : Union[float, np.ndarray]
+        Revenue from the landing charges in the first year, scalar or per sample
+    passenger_revenue : Union[float, np.ndarray]
+        Revenue from the passenger charges in the first year, scalar or per sample
+    opex : float
+        OPEX in the first year
+    years : int, optional
+        Number of years of operation, by default 40
+    mvts_growth : float, optional
+        Yearly growth of the movements (fraction), by default 0.0
+    pax_growth : float, optional
+        Yearly growth of the passengers (fraction), by default 0.0
+    opex_growth : float, optional
+        Yearly growth of the OPEX (fraction), by default 0.0
+    debt_share : float, optional
+        Share of the capex financed with a loan, by default 0.0
+    interest_rate : float, optional
+        Interest rate of the loan, by default 0.07
+    loan_term : int, optional
+        Number of yearly loan payments, by default 20
+
+    Returns
+    -------
+    np.ndarray
+        Cash flows with shape (samples, years + 1)
+    """
+    capex = np.asarray(capex, dtype=np.float64)
+    t = np.arange(years)
+
+    flows = np.empty((len(capex), years + 1))
+    flows[:, 0] = -(1 - debt_share) * capex
+
+    # Revenue and OPEX per year, per sample if the revenues are
+    flows[:, 1:] = np.outer(np.broadcast_to(landing_revenue, capex.shape), (1 + mvts_growth) ** t)
+    flows[:, 1:] += np.outer(np.broadcast_to(passenger_revenue, capex.shape), (1 + pax_growth) ** t)
+    flows[:, 1:] -= opex * (1 + opex_growth) ** t
+
+    # Financing cost
+    if debt_share > 0:
+        flows[:, 1 : min(loan_term, years) + 1] -= annuity(debt_share * capex, interest_rate, loan_term)[:, None]
+
+    return flows
+
+
+def net_present_value(flows: np.ndarray, rate: Union[float, np.ndarray]) -> np.ndarray:
+    """Net present value of cash flows with shape (samples, years + 1), for a discount rate
+    that is scalar or per sample"""
+    t = np.arange(flows.shape[1])
+    discount = (1 + np.asarray(rate, dtype=np.float64)[..., None]) ** -t
+    return np.sum(flows * discount, axis=1)
+
+
+def discounted_payback_period(flows: np.ndarray, rate: float) -> np.ndarray:
+    """Number of years until the discounted cash flows repay the initial investment, interpolated
+    within the year. Infinite if the investment is not repaid within the cash flows.
+
+    Parameters
+    ----------
+    flows : np.ndarray
+        Cash flows with shape (samples, years + 1)
+    rate : float
+        Discount rate
+
+    Returns
+    -------
+    np.ndarray
+        Discounted payback period per sample
+    """
+    cumulative = np.cumsum(flows * (1 + rate) ** -np.arange(flows.shape[1]), axis=1)
+
+    # First year with a non-negative cumulative discounted cash flow
+    repaid = cumulative >= 0
+    year = np.argmax(repaid, axis=1)
+    rows = np.arange(len(flows))
+
+    payback = np.full(len(flows), np.inf)
+    valid = repaid[rows, year] & (year > 0)
+    before, after = cumulative[rows[valid], year[valid] - 1], cumulative[rows[valid], year[valid]]
+    payback[valid] = year[valid] - 1 + -before / (after - before)
+    payback[repaid[:, 0]] = 0.0
+
+    return payback
+
+
+def internal_rate_of_return(flows: np.ndarray, tol: float = 1e-10, maxiter: int = 100) -> np.ndarray:
+    """Internal rate of return per sample, the discount rate for which the net present value is
+    zero. Solved for all samples at once with Newton's method, safeguarded by bisection on the
+    bracket (-0.99, 10). Samples without a root in the bracket get nan.
+
+    Parameters
+    ----------
+    flows : np.ndarray
+        Cash flows with shape (samples, years + 1), starting with an investment
+    tol : float, optional
+        Tolerance of the rate, by default 1e-10
+    maxiter : int, optional
+        Maximum number of iterations, by default 100
+
+    Returns
+    -------
+    np.ndarray
+        IRR per sample
+    """
+    # Years in rows, so each step of Horner's scheme works on contiguous samples
+    flows_by_year = np.ascontiguousarray(flows.T)
+
+    def npv_and_derivative(samples, rate):
+        """Net present value as a polynomial in the discount factor v = 1 / (1 + rate),
+        evaluated with Horner's scheme, and its derivative to the rate"""
+        v = 1 / (1 + rate)
+        npv = flows_by_year[-1, samples]
+        derivative = np.zeros_like(v)
+        for k in range(len(flows_by_year) - 2, -1, -1):
+            derivative = derivative * v + npv
+            npv = npv * v + flows_by_year[k, samples]
+        return npv, -derivative * v**2
+
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        # Only samples with a sign change in the bracket have a root
+        lower = np.full(len(flows), -0.99)
+        upper = np.full(len(flows), 10.0)
+        f_lower = npv_and_derivative(slice(None), lower)[0]
+        f_upper = npv_and_derivative(slice(None), upper)[0]
+        active = np.flatnonzero(np.sign(f_lower) * np.sign(f_upper) < 0)
+
+        irr = np.full(len(flows), np.nan)
+        rate = np.full(len(active), 0.1)
+        lower, upper, f_lower = lower[active], upper[active], f_lower[active]
+
+        # Iterate the samples that did not converge yet
+        for _ in range(maxiter):
+            if len(active) == 0:
+                break
+            npv, derivative = npv_and_derivative(active, rate)
+
+            # Keep the bracket with the sign change
+            same_as_lower = np.sign(npv) == np.sign(f_lower)
+            lower = np.where(same_as_lower, rate, lower)
+            upper = np.where(same_as_lower, upper, rate)
+
+            # Newton step, or bisection if it leaves the bracket. An exact root is kept.
+            step = rate - npv / derivative
+            new_rate = np.where((step > lower) & (step < upper), step, (lower + upper) / 2)
+            new_rate = np.where(npv == 0, rate, new_rate)
+
+            converged = (np.abs(new_rate - rate) < tol) | (npv == 0)
+            irr[active[converged]] = new_rate[converged]
+
+            keep = ~converged
+            active, rate, lower, upper, f_lower = active[keep], new_rate[keep], lower[keep], upper[keep], f_lower[keep]
+
+        # Best estimate for samples that did not converge within maxiter
+        irr[active] = rate
+
+    return irr
+
+
+def discounted_cash_flow(
+    capex: np.ndarray,
+    landing_revenue: Union[float, np.ndarray],
+    passenger_revenue: Union[float, np.ndarray],
+    opex: float,
+    discount_rate: float,
+    irr: bool = True,
+    memory_budget: int = 2**26,
+    **kwargs,
+) -> Columns:
+    """Discounted cash flow analysis of the simulated capex: the distributions of the net present
+    value, the internal rate of return and the discounted payback period. The cash flows (see
+    cash_flows) are built for a chunk of samples at a time, so the memory use is bounded by
+    memory_budget, also for a large number of samples and years.
+
+    Parameters
+    ----------
+    capex : np.ndarray
+        Simulated capital expenditure, shape (samples,)
+    landing_revenue : Union[float, np.ndarray]
+        Revenue from the landing charges in the first year
+    passenger_revenue : Union[float, np.ndarray]
+        Revenue from the passenger charges in the first year
+    opex : float
+        OPEX in the first year
+    discount_rate : float
+        Discount rate, e.g. the WACC
+    irr : bool, optional
+        Whether to calculate the internal rate of return, which takes most of the time. By default True
+    memory_budget : int, optional
+        Approximate maximum memory (bytes) for the intermediate arrays, by default 64 MB
+    **kwargs
+        Other arguments of cash_flows (years, growth rates and financing)
+
+    Returns
+    -------
+    Columns
+        Columns "NPV", "Discounted payback" and, if irr, "IRR"
+    """
+    capex = np.asarray(capex, dtype=np.float64)
+    n = len(capex)
+    years = kwargs.get("years", 40)
+
+    # The cash flows and a few temporary arrays of the same size are in memory at once
+    chunk_size = max(1, int(memory_budget // (6 * 8 * (years + 1))))
+
+    result = Columns(n)
+    result["NPV"] = np.empty(n)
+    result["Discounted payback"] = np.empty(n)
+    if irr:
+        result["IRR"] = np.empty(n)
+
+    for start in range(0, max(n, 1), chunk_size):
+        chunk = slice(start, min(start + chunk_size, n))
+        revenues = [
+            value[chunk] if np.ndim(value) > 0 else value for value in (landing_revenue, passenger_revenue)
+        ]
+        flows = cash_flows(capex[chunk], *revenues, opex, **kwargs)
+
+        result.raw("NPV")[chunk] = net_present_value(flows, discount_rate)
+        result.raw("Discounted payback")[chunk] = discounted_payback_period(flows, discount_rate)
+        if irr:
+            result.raw("IRR")[chunk] = internal_rate_of_return(flows)
+
+    return result
+
+
+class ConstructionSchedule(BaseModel):
+    """Construction schedule of a multi-phase programme: the share of the cost of each element
+    that is spent per year, and the yearly price escalation. Year 0 is priced at the current
+    prices, later years are escalated with a sampled index.
+
+    Parameters
+    ----------
+    phasing : Dict[str, List[float]]
+        Share of the cost of an element (e.g. 'Runway') per year, normalized to sum to 1.
+        Elements that are not in the schedule are built in year 0.
+    escalation : Tuple[float, float, float]
+        Minimum, most likely and maximum price escalation (% per year) of the triangular
+        distribution, sampled per sample and year. By default (0.0, 2.0, 5.0)
+    discount_rate : float
+        Discount rate (fraction per year) for the present value of the capex, by default 0.0
+    """
+
+    phasing: Dict[str, List[float]] = {}
+    escalation: Tuple[float, float, float] = (0.0, 2.0, 5.0)
+    discount_rate: float = 0.0
+
+    @property
+    def years(self) -> int:
+        """Number of construction years"""
+        return max([len(shares) for shares in self.phasing.values()], default=1)
+
+    def phasing_matrix(self, elements: List[str]) -> np.ndarray:
+        """Share of the cost of each element per year
+
+        Parameters
+        ----------
+        elements : List[str]
+            Names of the elements
+
+        Returns
+        -------
+        np.ndarray
+            Shares with shape (elements, years), rows summing to 1
+
+        Raises
+        ------
+        ValueError
+            If the shares of an element are negative or sum to zero
+        """
+        phasing = np.zeros((len(elements), self.years))
+        for i, element in enumerate(elements):
+            shares = np.asarray(self.phasing.get(element, [1.0]), dtype=np.float64)
+            if np.any(shares < 0) or shares.sum() <= 0:
+                raise ValueError(f'The phasing of "{element}" should be non-negative and not all zero.')
+            phasing[i, : len(shares)] = shares / shares.sum()
+
+        return phasing
+
+    def escalation_index(self, U: np.ndarray) -> np.ndarray:
+        """Price index per sample and year, relative to year 0, from uniforms for the yearly
+        escalation
+
+        Parameters
+        ----------
+        U : np.ndarray
+            Uniforms with shape (samples, years - 1)
+
+        Returns
+        -------
+        np.ndarray
+            Price index with shape (samples, years), 1 in year 0
+        """
+        from core import sampler
+
+        low, mode, high = self.escalation
+        if high > low:
+            rates = sampler.ppf("triang", [(mode - low) / (high - low), low, high - low], U) / 100
+        else:
+            rates = np.full(np.shape(U), low / 100)
+
+        index = np.ones((len(U), self.years))
+        np.cumprod(1 + rates, axis=1, out=index[:, 1:])
+        return index
+
+
+def phased_capex(costs: np.ndarray, phasing: np.ndarray, index: np.ndarray) -> np.ndarray:
+    """Nominal capex per sample and year: the cost of the elements spread over the years with
+    the phasing and escalated with the price index. Computed as one matrix product for all
+    samples and years.
+
+    Parameters
+    ----------
+    costs : np.ndarray
+        Cost of the elements at current prices, shape (samples, elements)
+    phasing : np.ndarray
+        Share of the cost of each element per year, shape (elements, years)
+    index : np.ndarray
+        Price index, shape (samples, years)
+
+    Returns
+    -------
+    np.ndarray
+        Nominal capex with shape (samples, years)
+    """
+    nominal = costs @ phasing
+    nominal *= index
+    return nominal
@@ -0,0 +1,130 @@
+from collections import deque
+from typing import Dict, List
+
+import numpy as np
+
+
+class Graph:
+    """Indexed structure of a directed graph: a name to index map and integer parent and child
+    adjacency arrays. The parents of a node are in the order of its edges. The topological order
+    is calculated on first use. A graph describes the structure at the moment it was created, so
+    it should be replaced after structural edits (nodes or edges removed, renamed or reordered),
+    except for added edges, which are registered with add_edge.
+
+    Parameters
+    ----------
+    names : List[str]
+        Node names
+    parent_names : List[List[str]]
+        Names of the parents of each node, in the order of the edges
+    """
+
+    def __init__(self, names: List[str], parent_names: List[List[str]]) -> None:
+        self.names = list(names)
+        self.index: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+
+        self.parents = [np.array([self.index[name] for name in parents], dtype=np.intp) for parents in parent_names]
+
+        children = [[] for _ in self.names]
+        for child, parents in enumerate(self.parents):
+            for parent in parents:
+                children[parent].append(child)
+        self.children = [np.array(nodes, dtype=np.intp) for nodes in children]
+
+        self._order = None
+        self._position = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @property
+    def order(self) -> List[int]:
+        """Topological order (Kahn's algorithm). Nodes without parents come first, in the order
+        of the nodes, except for disconnected nodes, which are added at the end.
+
+        Raises
+        ------
+        ValueError
+            If the graph contains a cycle
+        """
+        if self._order is None:
+            indegree = [len(parents) for parents in self.parents]
+            roots = [i for i in range(len(self)) if indegree[i] == 0]
+            queue = deque(
+                [i for i in roots if len(self.children[i]) > 0] + [i for i in roots if len(self.children[i]) == 0]
+            )
+
+            order = []
+            while queue:
+                i = queue.popleft()
+                order.append(i)
+                for child in self.children[i]:
+                    indegree[child] -= 1
+                    if indegree[child] == 0:
+                        queue.append(child)
+
+            if len(order) < len(self):
+                raise ValueError("The network contains a cycle.")
+
+            self._order = order
+
+        return self._order
+
+    @property
+    def position(self) -> np.ndarray:
+        """Position of each node in the topological order"""
+        if self._position is None:
+            position = np.empty(len(self), dtype=np.intp)
+            position[self.order] = np.arange(len(self))
+            self._position = position
+        return self._position
+
+    def reaches(self, source: int, target: int) -> bool:
+        """Whether there is a directed path from source to target, with a search over the
+        descendants of source that stops when target is found.
+
+        Parameters
+        ----------
+        source : int
+            Index of the first node
+        target : int
+            Index of the last node
+
+        Returns
+        -------
+        bool
+            True if target is a descendant of source (or the same node)
+        """
+        if source == target:
+            return True
+
+        visited = np.zeros(len(self), dtype=bool)
+        visited[source] = True
+        stack = [source]
+        while stack:
+            for child in self.children[stack.pop()]:
+                if child == target:
+                    return True
+                if not visited[child]:
+                    visited[child] = True
+                    stack.append(child)
+
+        return False
+
+    def add_edge(self, parent: int, child: int) -> None:
+        """Register an edge that was added to the graph, without creating it again. The edge must
+        not create a cycle (see reaches). The topological order is kept if it is still valid.
+
+        Parameters
+        ----------
+        parent : int
+            Index of the parent node
+        child : int
+            Index of the child node
+        """
+        self.parents[child] = np.append(self.parents[child], parent)
+        self.children[parent] = np.append(self.children[parent], child)
+
+        if self._order is not None and self.position[parent] > self.position[child]:
+            self._order = None
+            self._position = None
@@ -1,17 +1,346 @@
-import py_banshee
 import numpy as np
 import re
-import scipy.stats as stats
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from core.bn import BayesianNetwork, ranktopearson
+from core.cache import InferenceCache, inference_cache
+from core.columns import Columns
+from core.conditioning import get_engine
+from core.finance import ConstructionSchedule, net_present_value, phased_capex
+from core.models import BaseModel
+from core.rng import RandomStreams
+
+
+class MissingConditionError(ValueError):
+    """Raised when a project lacks a condition that the estimate needs"""
+
+
+def conditions_from_bn(bn: BayesianNetwork) -> dict:
+    """Construct the project conditions from a (saved) network, as the input form
+    would have done.
+
+    Parameters
+    ----------
+    bn : BayesianNetwork
+        Network with node conditions and project characteristics
+
+    Returns
+    -------
+    dict
+        Conditions that can be passed to MCM
+
+    Raises
+    ------
+    MissingConditionError
+        If the network has no condition for the aircraft code, which determines the geometry
+    """
+    ac_code = next((node.condition for node in bn.nodes if node.name == 'AC code'), 'n.a.')
+    if ac_code in ['n.a.', '']:
+        raise MissingConditionError('The project has no condition for the aircraft code (node "AC code"). Set it before estimating the cost.')
+    conditions = {'AC code': ac_code}
+
+    chars = bn.charlist[0] if len(bn.charlist) > 0 else None
+    prices = {'Concrete': 'c_concrete', 'Asphalt': 'c_asphalt', 'Cement Treated Base (CTB)': 'c_ctb', 'Sand': 'c_sand'}
+    for key, attr in prices.items():
+        conditions[key] = getattr(chars, attr) if chars is not None else 'n.a.'
+
+    ils = chars.ils if chars is not None else 'n.a.'
+    conditions['ILS'] = False if ils in ['n.a.', '0', ''] else ils
+    atc = chars.atc if chars is not None else 'n.a.'
+    conditions['Control Tower'] = 0 if atc in ['n.a.', '0', ''] else 2
+
+    return conditions
+
+
+def percentile_confidence_intervals(data: np.ndarray, percentiles: List[float], z: float = 1.96) -> List[Tuple[float, float]]:
+    """Distribution-free confidence intervals of percentiles, from the order statistics
+    around the percentile (normal approximation of the binomial distribution).
+
+    Parameters
+    ----------
+    data : np.ndarray
+        Samples
+    percentiles : List[float]
+        Percentiles (0-100)
+    z : float, optional
+        Standard normal quantile of the confidence level, by default 1.96 (95%)
+
+    Returns
+    -------
+    List[Tuple[float, float]]
+        Lower and upper bound per percentile
+    """
+    n = len(data)
+    p = np.asarray(percentiles, dtype=float) / 100
+    half_width = z * np.sqrt(n * p * (1 - p))
+    lower = np.clip(np.floor(n * p - half_width).astype(int), 0, n - 1)
+    upper = np.clip(np.ceil(n * p + half_width).astype(int), 0, n - 1)
+
+    ranks = np.unique(np.concatenate([lower, upper]))
+    values = dict(zip(ranks, np.partition(data, ranks)[ranks]))
+    return [(values[lo], values[hi]) for lo, hi in zip(lower, upper)]
+
+
+class EstimateCancelled(Exception):
+    """Raised inside a run when the estimate is cancelled"""
+
+
+class EstimateResult(BaseModel):
+    """Outcome of a cost estimate. All columns have length n."""
+
+    n: int
+    seed: int
+    names: List[str]
+    design_vars: Columns
+    simulated_cost: Columns
+    sim_data: Columns
+    # Whether the adaptive sampling met the tolerance. Always True for a fixed sample size.
+    converged: bool = True
+    # Nominal capex of the Simulation estimate per sample and year, with a construction schedule
+    phased_capex: Optional[np.ndarray] = None
+
+    @property
+    def nbytes(self) -> int:
+        """Memory footprint (bytes) of the simulated values"""
+        nbytes = self.design_vars.nbytes + self.simulated_cost.nbytes + self.sim_data.nbytes
+        return nbytes + (self.phased_capex.nbytes if self.phased_capex is not None else 0)
+
+    @classmethod
+    def concatenate(cls, results: List["EstimateResult"]) -> "EstimateResult":
+        """Combine the results of several batches into one result"""
+        return cls(
+            n=sum(result.n for result in results),
+            seed=results[0].seed,
+            names=results[0].names,
+            design_vars=Columns.concatenate([result.design_vars for result in results]),
+            simulated_cost=Columns.concatenate([result.simulated_cost for result in results]),
+            sim_data=Columns.concatenate([result.sim_data for result in results]),
+            phased_capex=np.concatenate([result.phased_capex for result in results]) if results[0].phased_capex is not None else None,
+        )
+
 
 class MCM:
-    def __init__(self, mainwindow):
-        self.mainwindow = mainwindow
-        self.signals = self.mainwindow.signals
-        self.project = self.mainwindow.project
+    """Monte Carlo cost estimator for a (conditioned) Bayesian network. The estimator
+    does not depend on the user interface, so it can be used from scripts as well.
+
+    Parameters
+    ----------
+    bn : BayesianNetwork
+        Network with the design variables. The node conditions are used as evidence.
+    conditions : dict
+        Project conditions, containing the 'AC code', the material prices
+        ('Concrete', 'Asphalt', 'Cement Treated Base (CTB)', 'Sand'), 'ILS' and 'Control Tower'.
+    n : int, optional
+        Sample size, by default 100000. With adaptive sampling, this is the maximum sample size.
+    seed : int, optional
+        Root seed of the random streams. If None, the seed stored in the project is used. If the
+        project has no seed either, a new one is generated and stored in the project. By default None
+    cache : InferenceCache, optional
+        Cache for inference results and latent residuals. By default the cache shared by the application is used.
+        Pass None to always sample.
+    tolerance : float, optional
+        Relative tolerance for adaptive sampling. If given, samples are drawn in batches until the
+        95% confidence intervals of the percentiles are narrower than tolerance times the percentile
+        (half-width). If None, n samples are drawn at once. By default None
+    percentiles : List[float], optional
+        Percentiles of the Simulation estimate that are checked for convergence, by default [10, 50, 90]
+    batch_size : int, optional
+        Number of samples per batch with adaptive sampling, by default 10000
+    time_budget : float, optional
+        Maximum time (seconds) for adaptive sampling. No new batch is started after this time.
+        By default None (no limit)
+    sampling : str, optional
+        Sampling method for the design variables and cost items: 'mc' (plain Monte Carlo),
+        'lhs' (Latin hypercube) or 'sobol' (scrambled Sobol' points), by default 'mc'
+    dtype : np.dtype, optional
+        Data type of the stored results. np.float32 halves the memory of large samples.
+        By default np.float64
+    quantile_tables : bool, optional
+        Transform the marginals that need the normal CDF (all but the normal and lognormal, see
+        core.sampler.DIRECT) with an interpolated quantile table, which is faster at a relative
+        error of about 1e-6 of the scale. By default False
+    check_correlations : bool, optional
+        Compare the correlation matrix of the BN with the one py_banshee calculates from the
+        conditional rank correlations (for validation runs), by default False
+    schedule : ConstructionSchedule, optional
+        Construction schedule with the phasing of the elements and the price escalation. If given,
+        the nominal and present value of the estimates are added to the results. By default None
+    """
+
+    def __init__(
+        self,
+        bn: BayesianNetwork,
+        conditions: dict,
+        n: int = 100000,
+        seed: int = None,
+        cache: InferenceCache = inference_cache,
+        tolerance: float = None,
+        percentiles: List[float] = None,
+        batch_size: int = 10000,
+        time_budget: float = None,
+        sampling: str = 'mc',
+        dtype: np.dtype = np.float64,
+        quantile_tables: bool = False,
+        check_correlations: bool = False,
+        schedule: ConstructionSchedule = None,
+    ):
+        self.bn = bn
+        self.conditions = conditions
+        self.prices = {key: conditions.get(key, 'n.a.') for key in ['Concrete', 'Asphalt', 'Cement Treated Base (CTB)', 'Sand']}
+        self.n = int(n)
+
+        if seed is None:
+            seed = bn.seed
+        self.streams = RandomStreams(seed)
+        self.seed = self.streams.seed
+        # Store the seed, so the estimate can be reproduced from the saved project
+        if bn.seed is None:
+            bn.seed = self.seed
+
+        self.cache = cache
+        self.cancelled = False
+
+        self.tolerance = tolerance
+        self.percentiles = [10, 50, 90] if percentiles is None else list(percentiles)
+        self.batch_size = int(batch_size)
+        self.time_budget = time_budget
+
+        if sampling not in RandomStreams.methods:
+            raise ValueError(f'Sampling method "{sampling}" unknown. Choose from: {", ".join(RandomStreams.methods)}.')
+        self.sampling = sampling
+        self.dtype = dtype
+        self.quantile_tables = quantile_tables
+        self.check_correlations = check_correlations
+        self.schedule = schedule
+
+        # Network definition, correlation matrix and conditioning engine, see snapshot
+        self.names = None
+        self.R = None
+        self.engine = None
+
+    def snapshot(self) -> None:
+        """Copy the nodes, conditions and correlations that the estimate needs from the network.
+        To run the estimate in a background thread, call this first on the thread that edits the
+        network. The run then only uses this snapshot, so the network can be edited meanwhile.
+        """
+        self.define_bn()
+        self.snapshot_correlations()
+
+    def snapshot_correlations(self) -> None:
+        """Take the correlation matrix and the conditioning engine from the network. The matrix is
+        replaced, not modified, when the network changes, so it is not copied.
+        """
+        nnodes = len(self.bn.nodes)
+        if self.bn.R.shape != (nnodes, nnodes):
+            self.bn.calculate_correlation_matrix()
+        self.R = self.bn.R
+        self.engine = self.bn.conditioning_engine
+
+    def cancel(self) -> None:
+        """Request to stop the estimate. The run stops at the next stage, batch or sampled variable."""
+        self.cancelled = True
+
+    def check_cancelled(self) -> None:
+        """Raise EstimateCancelled if the estimate is cancelled"""
+        if self.cancelled:
+            raise EstimateCancelled()
+
+    def run(self, progress_callback=None) -> Union[EstimateResult, None]:
+        """Define the BN, sample the design variables and simulate the cost
+
+        Parameters
+        ----------
+        progress_callback : callable, optional
+            Function that is called with a message at the start of each stage, by default None
+
+        Returns
+        -------
+        Union[EstimateResult, None]
+            Estimate, or None if the run was cancelled
+        """
+        if self.tolerance is not None:
+            return self.run_adaptive(progress_callback=progress_callback)
+
+        stages = [
+            ('Calculating conditional probabilities.', self.conditional_probabilities),
+            ('Sampling cost items.', self.sample_costs),
+            ('Aggregating simulated cost.', self.pavement_design),
+        ]
+
+        if self.names is None:
+            self.snapshot()
+        try:
+            for message, stage in stages:
+                self.check_cancelled()
+                if progress_callback is not None:
+                    progress_callback(message)
+                result = stage()
+        except EstimateCancelled:
+            return None
+
+        return result
+
+    def run_adaptive(self, progress_callback=None) -> Union[EstimateResult, None]:
+        """Sample in batches until the percentiles of the Simulation estimate have converged,
+        the time budget is used or the maximum sample size (n) is reached. Each batch draws
+        from its own random streams, so the result only depends on the seed and the number of batches.
+
+        Parameters
+        ----------
+        progress_callback : callable, optional
+            Function that is called with a message at the start of each batch, by default None
+
+        Returns
+        -------
+        Union[EstimateResult, None]
+            Estimate, or None if the run was cancelled
+        """
+        if self.names is None:
+            self.snapshot()
+
+        start = time.perf_counter()
+        results = []
+        nsampled = 0
+        converged = False
+
+        while nsampled < self.n:
+            if self.cancelled:
+                return None
+
+            size = min(self.batch_size, self.n - nsampled)
+            if progress_callback is not None:
+                progress_callback(f'Sampling batch {len(results) + 1} ({nsampled:,} samples drawn).')
 
-        self.bn = self.mainwindow.bn
+            try:
+                self.conditional_probabilities(chunk=len(results), size=size)
+                self.sample_costs(chunk=len(results), size=size)
+                results.append(self.pavement_design())
+            except EstimateCancelled:
+                return None
+            nsampled += size
+
+            # Check the confidence interval half-widths relative to the percentiles
+            simulation = np.concatenate([result.sim_data['Simulation'] for result in results])
+            values = np.percentile(simulation, self.percentiles)
+            intervals = percentile_confidence_intervals(simulation, self.percentiles)
+            converged = all((hi - lo) / 2 <= self.tolerance * abs(value) for value, (lo, hi) in zip(values, intervals))
+            if converged:
+                break
+
+            if self.time_budget is not None and time.perf_counter() - start > self.time_budget:
+                break
+
+        if progress_callback is not None:
+            progress_callback('Aggregating simulated cost.')
+
+        result = EstimateResult.concatenate(results)
+        result.converged = converged
+        return result
 
     def define_bn(self):
+        """Copy the node names, marginals, edges and conditions from the network. The node
+        parameters and edge lists are new lists, so later edits of the network do not change them."""
         self.ids = {key.name: i for i, key in enumerate(self.bn.nodes)}
 
         self.names = []
@@ -31,19 +360,7 @@ class MCM:
             self.names.append(node.name)
             self.distributions.append(node.distribution)
 
-            if self.size == 'small':
-                parameters = node.parameters_small
-            else:
-                parameters = node.parameters_large
-
-            if node.distribution == 'triang':
-                c_min, c_mode, c_max = parameters
-                c = (c_mode - c_min) / (c_max - c_min)
-                loc = c_min
-                scale = c_max - c_min
-                self.parameters.append([c, loc, scale])
-            else:
-                self.parameters.append(parameters)
+            self.parameters.append(node.scipy_parameters(self.size))
 
             parents = []
             rank_corrs = []
@@ -73,33 +390,171 @@ class MCM:
                     self.condition_values.append(float(node.condition))
 
         self.L_exit = self.d_sep - (self.W_RWY + self.W_TWY) / 2
-        self.design_vars = {key: None for key in self.names}
-        for node in self.condition_nodes:
-            self.design_vars[self.names[node]] = self.bn.nodes[node].condition
-        self.design_vars['AC code'] = self.W_RWY
-
-    def conditional_probabilities(self):
-        self.n = 100000
-        R = py_banshee.rankcorr.bn_rankcorr(self.ParentCell, self.RankCorr, var_names=self.names, is_data=False, plot=False)
-
-        self.F = py_banshee.prediction.inference(Nodes=self.condition_nodes,
-                                            Values=self.condition_values,
-                                            R=R,
-                                            DATA=[],
-                                            SampleSize=self.n,
-                                            empirical_data=False,
-                                            distributions=self.distributions,
-                                            parameters=self.parameters,
-                                            Output='full')
+        # Values of the conditioned design variables. The design variables of each batch
+        # are built from these, see conditional_probabilities.
+        self.conditioned_vars = {self.names[node]: self.bn.nodes[node].condition for node in self.condition_nodes}
+        self.conditioned_vars['AC code'] = self.W_RWY
+
+    @property
+    def evidence(self) -> Dict[str, float]:
+        """Conditioning values per node name, as used by the analytic queries of the BN
+        (e.g. BayesianNetwork.conditional_percentiles). Available after define_bn."""
+        return {self.names[i]: value for i, value in zip(self.condition_nodes, self.condition_values)}
+
+    def conditional_probabilities(self, chunk: int = 0, size: int = None):
+        """Sample the non-conditioned design variables, given the conditions
+
+        Parameters
+        ----------
+        chunk : int, optional
+            Chunk number, which selects the random stream, by default 0
+        size : int, optional
+            Sample size. If None, n is used. By default None
+        """
+        if size is None:
+            size = self.n
+
+        R = self.correlation_matrix()
+
+        # Reuse the samples if the same inference has been done before
+        key = InferenceCache.make_key(
+            R, self.distributions, self.parameters, self.condition_nodes, self.condition_values, size, self.seed, chunk, self.sampling,
+            quantile_tables=self.quantile_tables,
+        )
+        self.F = self.cache.get(key) if self.cache is not None else None
+
+        if self.F is None:
+            self.F = self.inference(R, chunk=chunk, size=size)
+
+            if self.cache is not None:
+                self.cache.put(key, self.F)
 
         dist_vars = [name for i, name in enumerate(self.names) if i not in self.condition_nodes]
 
         self.dist_vars = dict(zip(dist_vars, self.F[0]))
-        for key in self.dist_vars.keys():
-            self.design_vars[key] = self.dist_vars[key]
 
+        # Conditioned variables are stored as scalars
+        design_vars = Columns(size, dtype=self.dtype)
+        for key in self.names:
+            value = self.dist_vars.get(key, self.conditioned_vars.get(key))
+            design_vars[key] = float(value) if isinstance(value, str) else value
+        self.design_vars = design_vars
+
+
+    def correlation_matrix(self, atol: float = 1e-8) -> np.ndarray:
+        """Rank correlation matrix of the BN, as calculated by the BN (and shown in the user
+        interface). Taken from the snapshot (see snapshot), which is made here if there is none yet.
+
+        Parameters
+        ----------
+        atol : float, optional
+            Absolute tolerance of the comparison with py_banshee, if check_correlations is set. By default 1e-8
+
+        Returns
+        -------
+        np.ndarray
+            Rank correlation matrix
+
+        Raises
+        ------
+        ValueError
+            If check_correlations is set and the matrix differs from py_banshee's
+        """
+        if self.R is None:
+            self.snapshot_correlations()
+        R = self.R
+
+        if self.check_correlations:
+            # Imported here, as importing py_banshee takes seconds and is not needed
+            # to load or inspect a project
+            import py_banshee
+
+            R_banshee = py_banshee.rankcorr.bn_rankcorr(self.ParentCell, self.RankCorr, var_names=self.names, is_data=False, plot=False)
+            difference = np.max(np.abs(R - R_banshee), initial=0.0)
+            if difference > atol:
+                raise ValueError(f'The correlation matrix of the BN differs from py_banshee\'s by {difference:.3g}.')
+
+        return R
+
+    def inference(self, R: np.ndarray, chunk: int = 0, size: int = None) -> np.ndarray:
+        """Sample the non-conditioned nodes from the conditional distribution, as
+        py_banshee.prediction.inference does, but with the cached conditional operators
+        and drawing from the inference random stream with the selected sampling method.
+
+        Parameters
+        ----------
+        R : np.ndarray
+            Rank correlation matrix
+        chunk : int, optional
+            Chunk number, which selects the random stream, by default 0
+        size : int, optional
+            Sample size. If None, n is used. By default None
+
+        Returns
+        -------
+        np.ndarray
+            Samples with shape (1, number of non-conditioned nodes, size)
+        """
+        if size is None:
+            size = self.n
+
+        from core import sampler
+
+        nnodes = len(self.names)
+        remaining_nodes = [i for i in range(nnodes) if i not in self.condition_nodes]
+
+        # Conditioning values in the standard normal space
+        normal_cond = np.array([sampler.to_normal(self.distributions[i], self.parameters[i], value) for i, value in zip(self.condition_nodes, self.condition_values)])
+
+        # Conditional normal distribution. The operator is reused as long as the correlations
+        # and the conditioned nodes do not change.
+        engine = self.engine if R is self.R else get_engine(ranktopearson(np.asarray(R)))
+        operator = engine.operator(self.condition_nodes)
+
+        # The conditional sample is the conditional mean plus residuals, which do not depend on the
+        # conditioning values (nor on the marginals). The residuals of earlier runs are reused, so
+        # changing a conditioning value only shifts them, with the same random numbers.
+        key = 'residuals:' + InferenceCache.make_key(R, [], [], self.condition_nodes, [], size, self.seed, chunk, self.sampling)
+        residuals = self.cache.get(key) if self.cache is not None else None
+
+        if residuals is None:
+            # Transform uniforms to correlated normals. The uniforms are kept away from 0 and 1
+            # to avoid infinite normals.
+            U = self.streams.uniforms('inference', size, len(remaining_nodes), method=self.sampling, chunk=chunk)
+            U = np.clip(U, 1e-15, 1 - 1e-15)
+            residuals = operator.residuals(sampler.ppf('norm', [0, 1], U))
+
+            if self.cache is not None:
+                self.cache.put(key, residuals)
+
+        norm_samples = operator.mean(normal_cond) + residuals
+
+        F = np.zeros((1, len(remaining_nodes), size))
+        for k, i in enumerate(remaining_nodes):
+            self.check_cancelled()
+            if self.quantile_tables and self.distributions[i] not in sampler.DIRECT:
+                table = sampler.quantile_table(self.distributions[i], tuple(map(float, self.parameters[i])))
+                F[0, k, :] = table.from_normal(norm_samples[:, k])
+            else:
+                F[0, k, :] = sampler.from_normal(self.distributions[i], self.parameters[i], norm_samples[:, k])
+
+        return F
+
+    def sample_costs(self, chunk: int = 0, size: int = None) -> None:
+        """Sample the unit prices, supplements and add-on costs
+
+        Parameters
+        ----------
+        chunk : int, optional
+            Chunk number, which selects the random stream, by default 0
+        size : int, optional
+            Sample size. If None, n is used. By default None
+        """
+        if size is None:
+            size = self.n
+
+        from core import sampler
 
-    def pavement_design(self):
         # Define factors for financial circumstances for SEJ study cases
         c_TWY_ref = [157.9, 148.55, 46.47, 12.15]
         f_TWY = np.sum(c_TWY_ref)
@@ -144,73 +599,125 @@ class MCM:
                      'risk': [10.04, 17.41, 48.87]
                      }
 
-        # Simulate m2 prices and supplements according to triangular probability distribution
+        # Simulate m2 prices and supplements according to triangular probability distribution,
+        # from one column of uniforms per cost item (the last two for the ILS and control tower).
+        # The dimensions follow those of the design variables.
+        offset = len(self.names) - len(self.condition_nodes)
+        U = self.streams.uniforms('costs', size, len(SEJ_costs) + 2, method=self.sampling, chunk=chunk, offset=offset)
         self.cost_sims = {key: None for key in SEJ_costs.keys()}
 
-        for key, item in SEJ_costs.items():
+        for i, (key, item) in enumerate(SEJ_costs.items()):
+            self.check_cancelled()
             c_min, c_mode, c_max = item
             c = (c_mode - c_min) / (c_max - c_min)
 
-            self.cost_sims[key] = stats.triang.rvs(c=c, loc=c_min, scale=(c_max-c_min), size=self.n)
-
-        # For defined variables, fill array with n times the conditional value
-        for key, item in self.design_vars.items():
-            try:
-                len(item) < self.n
-                self.design_vars[key] = np.full(self.n, float(item))
-            except:
-                pass
+            self.cost_sims[key] = sampler.ppf('triang', [c, c_min, c_max - c_min], U[:, i])
 
         if self.conditions['ILS'] == False:
-            self.c_ILS = np.zeros(self.n)
+            self.c_ILS = 0.0
         else:
             if self.conditions['ILS'] == 'Cat I':
-                self.c_ILS = stats.uniform.rvs(size=self.n, loc=1582000, scale=(1685000 - 1582000))
+                self.c_ILS = sampler.ppf('uniform', [1582000, 1685000 - 1582000], U[:, -2])
             else:
-                self.c_ILS = stats.uniform.rvs(size=self.n, loc=2293000, scale=(2550000 - 2293000))
+                self.c_ILS = sampler.ppf('uniform', [2293000, 2550000 - 2293000], U[:, -2])
 
         if self.conditions['Control Tower'] == 0:
-            self.c_ATC = np.zeros(self.n)
+            self.c_ATC = 0.0
         else:
-            self.c_ATC = stats.expon.rvs(size=self.n, loc=814307.846885, scale=3706531.633851403)
-
-        self.simulations = {
-                       "A_RWY": [self.W_RWY * L_RWY for L_RWY in self.design_vars['L_RWY']],
-                       "A_tpds": [self.A_tpd * int(no_tpds) for no_tpds in self.design_vars['#Tpds']],
-                       "A_TWY": [self.W_TWY * L_TWY / 100 for L_TWY in self.design_vars['L_TWY']],
-                       "A_exits": [self.L_exit * self.W_TWY * int(no_exits) for no_exits in self.design_vars['#Exits']],
-                       "c_RWY": [self.f_RWY_c * m2_RWY for m2_RWY in self.cost_sims['m2_RWY']],
-                       "c_TWY": [self.f_TWY_c * m2_TWY for m2_TWY in self.cost_sims['m2_TWY']],
-                       "c_apron": [self.f_apron_c * m2_apron for m2_apron in self.cost_sims['m2_apron']],
-                       "c_airfield": [self.f_af_c * airfield for airfield in self.cost_sims['airfield']],
-                       "c_ILS": [self.c_ILS],
-                       "c_ATC": [self.c_ATC]
-                       }
-
-        self.elements = ['Runway', 'Taxiway', 'Apron', 'Airfield', 'ILS', 'Control Tower']
-        self.simulated_cost = {key: [] for key in self.elements}
-        self.simulated_cost['ILS'] = self.c_ILS
-        self.simulated_cost['Control Tower'] = self.c_ATC
-        self.sim_data = {'Simulation': [],
-                      'Rough estimate': []}
-
-        for sim in range(self.n):
-            rwy = (self.simulations['A_RWY'][sim] + self.simulations['A_tpds'][sim]) * self.simulations['c_RWY'][sim] * (1 + self.cost_sims['invest_RWY'][sim] / 100)
-            twy = (self.simulations['A_TWY'][sim] + self.simulations['A_exits'][sim]) * (1 + self.simulations['c_TWY'][sim] * self.cost_sims['invest_TWY'][sim] / 100)
-            apron = self.design_vars['A_Apron'][sim] * self.simulations['c_apron'][sim] * (1 + self.cost_sims['invest_apron'][sim] / 100)
-            airfield = self.simulations['c_airfield'][sim] * (1 + self.cost_sims['invest_af'][sim] / 100) + self.f_af_c * (self.c_ILS[sim] + self.c_ATC[sim])
-            self.simulated_cost['Runway'].append(rwy)
-            self.simulated_cost['Taxiway'].append(twy)
-            self.simulated_cost['Apron'].append(apron)
-            self.simulated_cost['Airfield'].append(airfield)
-
-            self.sim_data['Simulation'].append((np.sum([rwy, twy, apron]) + self.c_ILS[sim] + self.c_ATC[sim]) * (1 + self.cost_sims['risk'][sim] / 100))
-            self.sim_data['Rough estimate'].append(airfield * (1 + self.cost_sims['risk'][sim] / 100))
-
-        self.signals.simdata_about_to_be_updated.emit(self.sim_data)
-        self.mainwindow.simulated_cost = self.simulated_cost
-
-
-
+            self.c_ATC = sampler.ppf('expon', [814307.846885, 3706531.633851403], U[:, -1])
 
+        # Yearly price escalation of the construction schedule
+        if self.schedule is not None:
+            if self.schedule.years > 1:
+                U = self.streams.uniforms('finance', size, self.schedule.years - 1, method=self.sampling, chunk=chunk, offset=offset + len(SEJ_costs) + 2)
+            else:
+                U = np.empty((size, 0))
+            self.escalation_index = self.schedule.escalation_index(U)
+
+    def pavement_design(self) -> EstimateResult:
+        """Combine the design variables and sampled unit prices into element and total cost"""
+        n = len(self.cost_sims['risk'])
+        design_vars = self.design_vars.raw
+
+        # Element areas and unit prices, computed for all samples at once. The number of
+        # turnpads and exits are truncated to whole numbers. Conditioned design variables
+        # and absent add-ons remain scalars.
+        self.simulations = Columns(n, dtype=self.dtype, columns={
+                       "A_RWY": self.W_RWY * design_vars('L_RWY'),
+                       "A_tpds": self.A_tpd * np.trunc(design_vars('#Tpds')),
+                       "A_TWY": self.W_TWY * design_vars('L_TWY') / 100,
+                       "A_exits": self.L_exit * self.W_TWY * np.trunc(design_vars('#Exits')),
+                       "c_RWY": self.f_RWY_c * self.cost_sims['m2_RWY'],
+                       "c_TWY": self.f_TWY_c * self.cost_sims['m2_TWY'],
+                       "c_apron": self.f_apron_c * self.cost_sims['m2_apron'],
+                       "c_airfield": self.f_af_c * self.cost_sims['airfield'],
+                       "c_ILS": self.c_ILS,
+                       "c_ATC": self.c_ATC
+                       })
+        simulations = self.simulations.raw
 
+        self.elements = ['Runway', 'Taxiway', 'Apron', 'Airfield', 'ILS', 'Control Tower']
+        self.simulated_cost = Columns(n, dtype=self.dtype, columns={
+            'Runway': (simulations('A_RWY') + simulations('A_tpds')) * simulations('c_RWY') * (1 + self.cost_sims['invest_RWY'] / 100),
+            'Taxiway': (simulations('A_TWY') + simulations('A_exits')) * (1 + simulations('c_TWY') * self.cost_sims['invest_TWY'] / 100),
+            'Apron': design_vars('A_Apron') * simulations('c_apron') * (1 + self.cost_sims['invest_apron'] / 100),
+            'Airfield': simulations('c_airfield') * (1 + self.cost_sims['invest_af'] / 100) + self.f_af_c * (self.c_ILS + self.c_ATC),
+            'ILS': self.c_ILS,
+            'Control Tower': self.c_ATC
+        })
+        simulated_cost = self.simulated_cost.raw
+
+        # Total investment cost including the risk reserve
+        risk = 1 + self.cost_sims['risk'] / 100
+        self.sim_data = Columns(n, dtype=self.dtype, columns={
+            'Simulation': (simulated_cost('Runway') + simulated_cost('Taxiway') + simulated_cost('Apron') + self.c_ILS + self.c_ATC) * risk,
+            'Rough estimate': simulated_cost('Airfield') * risk
+        })
+
+        phased_capex = self.phase_costs(risk) if self.schedule is not None else None
+
+        return EstimateResult(
+            n=n,
+            seed=self.seed,
+            names=self.names,
+            design_vars=self.design_vars,
+            simulated_cost=self.simulated_cost,
+            sim_data=self.sim_data,
+            phased_capex=phased_capex,
+        )
+
+    def phase_costs(self, risk: np.ndarray) -> np.ndarray:
+        """Spread the element cost over the years of the construction schedule and escalate the
+        prices. Adds the nominal and present value of the estimates to sim_data.
+
+        Parameters
+        ----------
+        risk : np.ndarray
+            Risk reserve factor per sample
+
+        Returns
+        -------
+        np.ndarray
+            Nominal capex of the Simulation estimate with shape (samples, years)
+        """
+        n = self.sim_data.n
+        rate = self.schedule.discount_rate
+
+        # Elements of the Simulation estimate, at current prices including the risk reserve
+        elements = ['Runway', 'Taxiway', 'Apron', 'ILS', 'Control Tower']
+        costs = np.empty((n, len(elements)))
+        for i, element in enumerate(elements):
+            costs[:, i] = self.simulated_cost.raw(element)
+        costs *= np.reshape(risk, (-1, 1))
+
+        nominal = phased_capex(costs, self.schedule.phasing_matrix(elements), self.escalation_index)
+        self.sim_data['Simulation (nominal)'] = nominal.sum(axis=1)
+        self.sim_data['Simulation (present value)'] = net_present_value(nominal, rate)
+
+        # The rough estimate follows the phasing of the airfield
+        airfield = np.broadcast_to(self.simulated_cost.raw('Airfield') * risk, (n,))
+        rough = phased_capex(airfield[:, None], self.schedule.phasing_matrix(['Airfield']), self.escalation_index)
+        self.sim_data['Rough estimate (nominal)'] = rough.sum(axis=1)
+        self.sim_data['Rough estimate (present value)'] = net_present_value(rough, rate)
+
+        return nominal.astype(self.dtype, copy=False)
@@ -81,6 +81,26 @@ class Node(BaseModel):
     def get_edge_by_parent(self, parent_name: str) -> Edge:
         return self.edges[self.parent_index(parent_name)]
 
+    def scipy_parameters(self, size: str) -> List[float]:
+        """Distribution parameters in the order of scipy.stats. Triangular distributions
+        are specified as (min, mode, max) and converted to (c, loc, scale).
+
+        Parameters
+        ----------
+        size : str
+            Parameter set, "small" (aircraft codes A-C) or "large"
+
+        Returns
+        -------
+        List[float]
+            Parameters
+        """
+        parameters = self.parameters_small if size == "small" else self.parameters_large
+        if self.distribution == "triang":
+            c_min, c_mode, c_max = parameters
+            return [(c_mode - c_min) / (c_max - c_min), c_min, c_max - c_min]
+        return list(parameters)
+
 class ProjectCharacteristics(BaseModel):
     project_name: str
     pax: str
@@ -1,6 +1,6 @@
 import logging
 from pathlib import Path
-from typing import Tuple, Union
+from typing import List, Tuple, Union
 
 import numpy as np
 from core.bn import BayesianNetwork
@@ -40,10 +40,14 @@ class Project:
         self.signals.node_order_about_to_change.connect(self.change_node_order)
         self.signals.parent_order_about_to_change.connect(self.change_parent_order)
 
-    def update_bn(self) -> None:
-        """Updates the BN model by calculating the correlation matrix, correlation bounds, and edges"""
+    def update_bn(self, changed: List[str] = None) -> None:
+        """Updates the BN model by calculating the correlation matrix, correlation bounds, and edges.
+        If the changed nodes are given, only the part that depends on them is recalculated."""
         if len(self.bn.nodes) == 0:
             self.bn.R = np.empty((0, 0), dtype=np.float64)
+        elif changed is not None:
+            logger.info("Updating correlation matrix and bounds.")
+            self.bn.update_correlation_matrix(changed)
         else:
             logger.info("Calculating correlation matrix and bounds.")
             self.bn.calculate_correlation_matrix()
@@ -60,7 +64,8 @@ class Project:
         name = self.bn._get_unused_name()
         self.bn.add_node(name=name, parents=[], rank_corrs=[])
         # Add coordinates to Node
-        self.update_bn()
+        # The new node has no edges, so no correlations change
+        self.update_bn(changed=[])
 
         logger.info(f'Node "{name}" added.')
         self.signals.lists_changed.emit()
@@ -86,7 +91,7 @@ class Project:
         self.signals.lists_about_to_change.emit()
         self.bn.remove_edge(parent, child)
         logger.info(f'Edge from "{parent}" to "{child}" removed.')
-        self.update_bn()
+        self.update_bn(changed=[child])
         self.signals.edge_removed.emit(parent, child)
         self.signals.lists_changed.emit()
 
@@ -99,7 +104,7 @@ class Project:
         succes = self.bn.add_edge(*edge)
         if succes:
             logger.info(f'Edge from "{edge[0]}" to "{edge[1]}" added.')
-            self.update_bn()
+            self.update_bn(changed=[edge[1]])
             # Emit the signal that will update the plots
             self.signals.edge_added.emit(*edge)
 
@@ -114,7 +119,7 @@ class Project:
         succes = self.bn.reverse_edge(parent, child)
         if succes:
             logger.info(f'Edge from "{parent}" to "{child}" reversed.')
-            self.update_bn()
+            self.update_bn(changed=[parent, child])
             # Emit the signal that will update the plots
             self.signals.edge_reversed.emit(parent, child)
 
@@ -133,10 +138,10 @@ class Project:
         corr = float(corr)
 
         # Check if the correlation is within bounds
-        edge = node.edges[iparent]
-        if corr < edge.rank_corr_bounds[0] or corr > edge.rank_corr_bounds[-1]:
+        bounds = self.bn.get_correlation_bounds(parent, child)
+        if corr < bounds[0] or corr > bounds[-1]:
             node.edges[iparent].rank_corr = oldvalue
-            raise ValueError("Choose a value in between {:.4g} and {:.4g}".format(*edge.rank_corr_bounds))
+            raise ValueError("Choose a value in between {:.4g} and {:.4g}".format(*bounds))
 
         # Calculate the conditional correlation from the observed correlation
         cond_corr = self.bn.calculate_conditional_correlation(parent, child, observed=corr)
@@ -153,7 +158,7 @@ class Project:
 
         logger.info(f'Conditional edge ("{parent}" to "{child}") correlation changed to {corr}.')
         self.signals.lists_about_to_change.emit()
-        self.update_bn()
+        self.update_bn(changed=[child])
         self.signals.correlation_changed.emit()
         self.signals.lists_changed.emit()
 
@@ -180,6 +185,7 @@ class Project:
 
         # Change the node order
         self.bn.nodes.insert(target_pos, self.bn.nodes.pop(source_pos))
+        self.bn.invalidate_graph()
         requested_order = self.bn._node_names
 
         # Reorder the nodes
@@ -273,18 +279,24 @@ class Project:
             else:
                 fname = Path(fname)
 
+        # Load from file. The current project is only cleared once the file is found valid.
+        loaded_bn = BayesianNetwork.parse_file(fname)
+        if not loaded_bn.is_dag:
+            NotificationDialog(f'"{fname.name}" was not opened, as the BN is not a DAG.')
+            return None
+
         # Clear current project
         self.new()
 
         # Open project
         self.mainwindow.setCursorWait()
 
-        # Load from file
         self.signals.lists_about_to_change.emit()
-        loaded_bn = BayesianNetwork.parse_file(fname)
         self.bn.nodes.extend(loaded_bn.nodes)
+        self.bn.invalidate_graph()
         self.bn.charlist.remove(self.bn.charlist[0])
         self.bn.charlist.extend(loaded_bn.charlist)
+        self.bn.seed = loaded_bn.seed
         self.update_bn()
 
         lib = {'Projected annual operations': 'Mvts',
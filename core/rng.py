@@ -0,0 +1,116 @@
+import warnings
+from typing import Union
+
+import numpy as np
+
+
+class RandomStreams:
+    """Hierarchy of independent random number generators, derived from a single seed.
+
+    The root SeedSequence is spawned into one sequence per stage. Each stage sequence
+    is in turn split per worker and per chunk, so every part of a (chunked or parallel)
+    simulation draws from its own stream. The same seed always gives the same streams,
+    regardless of the order in which they are requested.
+
+    Parameters
+    ----------
+    seed : int, optional
+        Root seed. If None, a new seed is generated from OS entropy. By default None
+    """
+
+    # Sampling methods for the uniforms, see RandomStreams.uniforms
+    methods = ["mc", "lhs", "sobol"]
+
+    # Order matters, as the index determines the stream. Add new stages at the end.
+    stages = [
+        "inference",  # Conditional design variables (MCM.inference)
+        "costs",  # Unit prices, supplements and add-ons (MCM.sample_costs)
+        "unconditional",  # Latent normals of the network (BayesianNetwork.iter_mvn_sample)
+        "finance",  # Price escalation of the construction schedule (MCM.sample_costs)
+    ]
+
+    def __init__(self, seed: Union[int, None] = None) -> None:
+        self.root = np.random.SeedSequence(seed)
+        self.seed = self.root.entropy
+        self.stage_sequences = dict(zip(self.stages, self.root.spawn(len(self.stages))))
+
+    def sequence(self, stage: str, chunk: int = 0, worker: int = 0) -> np.random.SeedSequence:
+        """Seed sequence for a stage, chunk and worker
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage, one of RandomStreams.stages
+        chunk : int, optional
+            Chunk number, by default 0
+        worker : int, optional
+            Worker number, by default 0
+
+        Returns
+        -------
+        np.random.SeedSequence
+            Seed sequence
+        """
+        if stage not in self.stage_sequences:
+            raise KeyError(f'Stage "{stage}" unknown. Choose from: {", ".join(self.stages)}.')
+
+        # Equal to spawning the stage sequence per worker and then per chunk, but without
+        # depending on how many children were spawned before
+        parent = self.stage_sequences[stage]
+        return np.random.SeedSequence(parent.entropy, spawn_key=parent.spawn_key + (worker, chunk))
+
+    def generator(self, stage: str, chunk: int = 0, worker: int = 0) -> np.random.Generator:
+        """Random generator for a stage, chunk and worker. See RandomStreams.sequence"""
+        return np.random.default_rng(self.sequence(stage, chunk=chunk, worker=worker))
+
+    def uniforms(
+        self, stage: str, size: int, d: int, method: str = "mc", chunk: int = 0, worker: int = 0, offset: int = 0
+    ) -> np.ndarray:
+        """Uniform samples on the unit hypercube for a stage, chunk and worker. Besides plain
+        Monte Carlo, Latin hypercube and scrambled Sobol' points (quasi-Monte Carlo) are
+        available, which cover the hypercube more evenly and reduce the sample size needed
+        for stable percentiles.
+
+        Parameters
+        ----------
+        stage : str
+            Name of the stage, one of RandomStreams.stages
+        size : int
+            Number of samples
+        d : int
+            Number of dimensions
+        method : str, optional
+            Sampling method, one of RandomStreams.methods, by default "mc"
+        chunk : int, optional
+            Chunk number, by default 0
+        worker : int, optional
+            Worker number, by default 0
+        offset : int, optional
+            Number of Sobol' dimensions used by other stages of the same simulation, by default 0.
+            Independently scrambled copies of the same Sobol' dimensions are dependent, so stages
+            that are combined sample by sample should use different dimensions.
+
+        Returns
+        -------
+        np.ndarray
+            Samples with shape (size, d)
+        """
+        rng = self.generator(stage, chunk=chunk, worker=worker)
+
+        if method == "mc":
+            return rng.random((size, d))
+
+        # Imported here, as scipy.stats is slow to import
+        from scipy.stats import qmc
+
+        if method == "lhs":
+            return qmc.LatinHypercube(d, seed=rng).random(size)
+
+        elif method == "sobol":
+            # The balance properties are best for powers of 2, but any size gives a valid
+            # (randomized) sample. The batch sizes are chosen by the user, so do not warn.
+            with warnings.catch_warnings():
+                warnings.filterwarnings("ignore", message=".*balance properties of Sobol")
+                return qmc.Sobol(offset + d, scramble=True, seed=rng).random(size)[:, offset:]
+
+        raise ValueError(f'Sampling method "{method}" unknown. Choose from: {", ".join(self.methods)}.')
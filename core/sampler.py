@@ -0,0 +1,213 @@
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+from scipy.special import ndtr, ndtri
+
+
+def _triang_ppf(u: np.ndarray, c: float, loc: float, scale: float) -> np.ndarray:
+    return loc + scale * np.where(u < c, np.sqrt(c * u), 1 - np.sqrt((1 - c) * (1 - u)))
+
+
+def _lognorm_ppf(u: np.ndarray, s: float, loc: float = 0.0, scale: float = 1.0) -> np.ndarray:
+    return loc + scale * np.exp(s * ndtri(u))
+
+
+def _expon_ppf(u: np.ndarray, loc: float = 0.0, scale: float = 1.0) -> np.ndarray:
+    return loc - scale * np.log1p(-u)
+
+
+def _uniform_ppf(u: np.ndarray, loc: float = 0.0, scale: float = 1.0) -> np.ndarray:
+    return loc + scale * u
+
+
+def _norm_ppf(u: np.ndarray, loc: float = 0.0, scale: float = 1.0) -> np.ndarray:
+    return loc + scale * ndtri(u)
+
+
+# Closed-form inverse CDFs, with the parameters in the same order as scipy.stats
+PPF: Dict[str, Callable] = {
+    "triang": _triang_ppf,
+    "lognorm": _lognorm_ppf,
+    "expon": _expon_ppf,
+    "uniform": _uniform_ppf,
+    "norm": _norm_ppf,
+}
+
+
+def _triang_cdf(x: np.ndarray, c: float, loc: float, scale: float) -> np.ndarray:
+    y = np.clip((x - loc) / scale, 0, 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(y < c, y**2 / c, 1 - np.where(c < 1, (1 - y) ** 2 / (1 - c), 0))
+
+
+def _expon_cdf(x: np.ndarray, loc: float = 0.0, scale: float = 1.0) -> np.ndarray:
+    return -np.expm1(-np.clip((x - loc) / scale, 0, None))
+
+
+def _uniform_cdf(x: np.ndarray, loc: float = 0.0, scale: float = 1.0) -> np.ndarray:
+    return np.clip((x - loc) / scale, 0, 1)
+
+
+# Closed-form CDFs. The normal and lognormal distributions are handled by to_normal.
+CDF: Dict[str, Callable] = {
+    "triang": _triang_cdf,
+    "expon": _expon_cdf,
+    "uniform": _uniform_cdf,
+}
+
+
+def ppf(distribution: str, parameters: List[float], u: np.ndarray) -> np.ndarray:
+    """Inverse CDF of a marginal distribution, for an array of uniforms. The supported
+    families (see PPF) are evaluated in closed form, others with scipy.stats.
+
+    Parameters
+    ----------
+    distribution : str
+        Name of the distribution in scipy.stats, e.g. 'triang'
+    parameters : List[float]
+        Parameters in the order of scipy.stats, e.g. [c, loc, scale] for 'triang'
+    u : np.ndarray
+        Uniforms, of any shape
+
+    Returns
+    -------
+    np.ndarray
+        Samples with the shape of u
+    """
+    if distribution in PPF:
+        return PPF[distribution](np.asarray(u, dtype=float), *parameters)
+
+    import scipy.stats
+
+    return getattr(scipy.stats, distribution).ppf(u, *parameters)
+
+
+def from_normal(distribution: str, parameters: List[float], z: np.ndarray) -> np.ndarray:
+    """Transform standard normal samples to a marginal distribution (the copula transform).
+    The normal and lognormal distributions are computed from z directly, which avoids
+    the round trip through the uniforms and keeps the tails exact.
+
+    Parameters
+    ----------
+    distribution : str
+        Name of the distribution in scipy.stats
+    parameters : List[float]
+        Parameters in the order of scipy.stats
+    z : np.ndarray
+        Standard normal samples
+
+    Returns
+    -------
+    np.ndarray
+        Samples with the shape of z
+    """
+    if distribution == "norm":
+        loc, scale = parameters
+        return loc + scale * z
+    elif distribution == "lognorm":
+        s, loc, scale = parameters
+        return loc + scale * np.exp(s * z)
+
+    return ppf(distribution, parameters, ndtr(z))
+
+
+def to_normal(distribution: str, parameters: List[float], x: np.ndarray) -> np.ndarray:
+    """Transform values of a marginal distribution to standard normal space, the inverse of
+    from_normal. Used for the conditioning values.
+
+    Parameters
+    ----------
+    distribution : str
+        Name of the distribution in scipy.stats
+    parameters : List[float]
+        Parameters in the order of scipy.stats
+    x : np.ndarray
+        Values
+
+    Returns
+    -------
+    np.ndarray
+        Standard normal values with the shape of x
+    """
+    x = np.asarray(x, dtype=float)
+    if distribution == "norm":
+        loc, scale = parameters
+        return (x - loc) / scale
+    elif distribution == "lognorm":
+        s, loc, scale = parameters
+        with np.errstate(divide="ignore"):
+            return np.log(np.clip((x - loc) / scale, 0, None)) / s
+    elif distribution in CDF:
+        return ndtri(CDF[distribution](x, *parameters))
+
+    import scipy.stats
+
+    return ndtri(getattr(scipy.stats, distribution).cdf(x, *parameters))
+
+
+# Families that are transformed from standard normal space without the normal CDF, for which a
+# quantile table is not faster than the exact transform
+DIRECT: List[str] = ["norm", "lognorm"]
+
+
+class QuantileTable:
+    """Inverse CDF interpolated from a table of exact quantiles. The table is equidistant in
+    standard normal space, so the tails are resolved as well as the body of the distribution,
+    and a sample is looked up by index arithmetic instead of a search. This avoids the normal
+    CDF and inverse CDF per sample, and scipy's slow numerical inversion for families without
+    a closed-form inverse CDF.
+
+    Parameters
+    ----------
+    distribution : str
+        Name of the distribution in scipy.stats
+    parameters : List[float]
+        Parameters in the order of scipy.stats
+    points : int, optional
+        Number of points in the table, by default 8193
+    zmax : float, optional
+        Range of the table in standard normal space (-zmax, zmax). Samples beyond the range
+        get the outermost quantile. By default 8.0
+    """
+
+    def __init__(self, distribution: str, parameters: List[float], points: int = 8193, zmax: float = 8.0) -> None:
+        self.distribution = distribution
+        self.parameters = list(parameters)
+        self.z = np.linspace(-zmax, zmax, points)
+        self.u = ndtr(self.z)
+        self.x = from_normal(distribution, parameters, self.z)
+
+    def ppf(self, u: np.ndarray) -> np.ndarray:
+        """Interpolated inverse CDF for an array of uniforms"""
+        return np.interp(u, self.u, self.x)
+
+    def from_normal(self, z: np.ndarray) -> np.ndarray:
+        """Interpolated transform of standard normal samples"""
+        # Position in the equidistant table, and the fraction to the next point
+        position = np.clip((np.asarray(z, dtype=float) - self.z[0]) / (self.z[1] - self.z[0]), 0, len(self.z) - 1)
+        i = np.minimum(position.astype(np.intp), len(self.z) - 2)
+        position -= i
+
+        lower = self.x[i]
+        return lower + position * (self.x[i + 1] - lower)
+
+
+@lru_cache(maxsize=256)
+def quantile_table(distribution: str, parameters: Tuple[float]) -> QuantileTable:
+    """Quantile table of a marginal distribution, created once per distribution and parameters
+
+    Parameters
+    ----------
+    distribution : str
+        Name of the distribution in scipy.stats
+    parameters : Tuple[float]
+        Parameters in the order of scipy.stats
+
+    Returns
+    -------
+    QuantileTable
+        Table
+    """
+    return QuantileTable(distribution, list(parameters))
+
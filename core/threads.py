@@ -35,9 +35,9 @@ class Worker(QObject, QRunnable):
         else:
             if not result is None:
                 self.result.emit(result)
-                self.finished.emit()
-        # finally:
-        # self.finished.emit()
+        finally:
+            # Also when the function failed or returned nothing (e.g. a cancelled estimate)
+            self.finished.emit()
 
 
 class ThreadResizeCanvas(FigureCanvasQTAgg):
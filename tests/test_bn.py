@@ -0,0 +1,171 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from core.bn import BayesianNetwork
+
+TEMPLATE = Path(__file__).resolve().parents[1] / "data" / "template.json"
+
+
+def test_save_and_reload_edited_network(tmp_path):
+    bn = BayesianNetwork.model_validate_json(TEMPLATE.read_text())
+    bn.add_edge("Mvts", "AC code", 0.3)
+    bn.update_correlation_matrix(["AC code"])
+
+    path = tmp_path / "edited.json"
+    bn.to_json(path)
+    loaded = BayesianNetwork.model_validate_json(path.read_text())
+
+    # The bounds are saved for the current correlations
+    for node, loaded_node in zip(bn.nodes, loaded.nodes):
+        for edge, loaded_edge in zip(node.edges, loaded_node.edges):
+            assert np.all(np.isfinite(loaded_edge.rank_corr_bounds))
+            assert loaded_edge.rank_corr_bounds == bn.get_correlation_bounds(edge.parent, edge.child)
+
+
+def test_mvn_sample_is_reproducible_from_the_seed():
+    bn = BayesianNetwork.model_validate_json(TEMPLATE.read_text())
+    bn.calculate_correlation_matrix()
+
+    first = bn.draw_mvn_sample(1000)
+    assert bn.seed is not None
+    np.testing.assert_array_equal(bn.draw_mvn_sample(1000), first)
+
+
+def test_add_edge_rejects_cycles():
+    bn = BayesianNetwork.model_validate_json(TEMPLATE.read_text())
+
+    # #Exits descends from Mvts through L_RWY and L_TWY
+    assert not bn.add_edge("#Exits", "Mvts")
+    assert "#Exits" not in bn._get_node_by_name("Mvts").parent_names
+    assert bn.add_edge("#Exits", "A_Apron")
+    assert bn.is_dag
+    assert not bn.add_edge("A_Apron", "L_RWY")
+
+
+def test_exceedance_probability_inverts_conditional_percentiles():
+    bn = BayesianNetwork.model_validate_json(TEMPLATE.read_text())
+    bn.calculate_correlation_matrix()
+    evidence = {"Mvts": 50000.0, "AC code": 30.0}
+
+    percentiles = np.array([0.1, 5, 50, 95, 99.9])
+    values = bn.conditional_percentiles("L_RWY", percentiles, evidence=evidence, size="small")
+    probabilities = bn.exceedance_probability("L_RWY", values, evidence=evidence, size="small")
+    np.testing.assert_allclose(probabilities, 1 - percentiles / 100, rtol=1e-9)
+
+
+def random_network(rng, nnodes=8, density=0.4):
+    """Random DAG with normal marginals, in which node i can have parents from nodes before i"""
+    bn = BayesianNetwork()
+    for i in range(nnodes):
+        parents = [f"X{j}" for j in range(i) if rng.random() < density]
+        rng.shuffle(parents)
+        rank_corrs = list(rng.uniform(-0.6, 0.6, len(parents)))
+        bn.add_node(
+            name=f"X{i}", parents=parents, rank_corrs=rank_corrs, distribution="norm", parameters_small=[0.0, 1.0], parameters_large=[0.0, 1.0]
+        )
+    return bn
+
+
+def test_correlation_matrix_of_two_parents():
+    bn = BayesianNetwork()
+    bn.add_node(name="A", distribution="norm", parameters_small=[0.0, 1.0], parameters_large=[0.0, 1.0])
+    bn.add_node(name="B", distribution="norm", parameters_small=[0.0, 1.0], parameters_large=[0.0, 1.0])
+    bn.add_node(name="C", parents=["A", "B"], rank_corrs=[0.5, -0.4], distribution="norm", parameters_small=[0.0, 1.0], parameters_large=[0.0, 1.0])
+    bn.calculate_correlation_matrix()
+    bn.calculate_correlation_bounds()
+
+    # The parents are independent, so the correlation with B is the conditional one scaled by
+    # the variance of C that A does not explain (in the normal space)
+    r_ac = 2 * np.sin(np.pi * 0.5 / 6)
+    r_bc = 2 * np.sin(np.pi * -0.4 / 6) * np.sqrt(1 - r_ac**2)
+    expected = np.eye(3)
+    expected[0, 2] = expected[2, 0] = 0.5
+    expected[1, 2] = expected[2, 1] = 6 / np.pi * np.arcsin(r_bc / 2)
+    np.testing.assert_allclose(bn.R, expected, atol=1e-14)
+
+    upper = 6 / np.pi * np.arcsin(np.sqrt(1 - r_ac**2) / 2)
+    assert bn.get_correlation_bounds("A", "C") == (-1.0, 1.0)
+    np.testing.assert_allclose(bn.get_correlation_bounds("B", "C"), (-upper, upper), atol=1e-14)
+
+
+def test_correlation_matrix_matches_py_banshee():
+    py_banshee = pytest.importorskip("py_banshee")
+
+    rng = np.random.default_rng(1)
+    for _ in range(5):
+        bn = random_network(rng)
+        bn.calculate_correlation_matrix()
+
+        names = [node.name for node in bn.nodes]
+        parents = [[names.index(edge.parent) for edge in node.edges] for node in bn.nodes]
+        rank_corrs = [[edge.cond_rank_corr for edge in node.edges] for node in bn.nodes]
+        R = py_banshee.rankcorr.bn_rankcorr(parents, rank_corrs, var_names=names, is_data=False, plot=False)
+        np.testing.assert_allclose(bn.R, R, rtol=0, atol=1e-13)
+
+
+def test_correlation_bounds_are_the_correlations_at_full_conditional_correlation():
+    rng = np.random.default_rng(2)
+    for _ in range(3):
+        bn = random_network(rng)
+        bn.calculate_correlation_matrix()
+        bn.calculate_correlation_bounds()
+
+        # A bound is the correlation of the edge when its conditional correlation is -1 or 1,
+        # given the conditional correlations of the earlier edges
+        for node in bn.nodes:
+            for k, edge in enumerate(node.edges):
+                bounds = bn.get_correlation_bounds(edge.parent, node.name)
+                for cond_rank_corr, bound in zip([-1.0, 1.0], bounds):
+                    extreme = bn.model_copy(deep=True)
+                    extreme.invalidate_graph()
+                    extreme._get_node_by_name(node.name).edges[k].cond_rank_corr = cond_rank_corr
+                    extreme.calculate_correlation_matrix()
+                    i, j = extreme.graph.index[node.name], extreme.graph.index[edge.parent]
+                    assert extreme.R[i, j] == pytest.approx(bound, abs=1e-13)
+
+
+def test_incremental_update_matches_full_recalculation():
+    rng = np.random.default_rng(3)
+    bn = random_network(rng, nnodes=10)
+    bn.calculate_correlation_matrix()
+    bn.calculate_correlation_bounds()
+
+    # Change a conditional correlation, add an edge and add a node
+    node = next(node for node in bn.nodes[5:] if len(node.edges) > 0)
+    node.edges[0].cond_rank_corr = 0.3
+    bn.update_correlation_matrix([node.name])
+    assert bn.add_edge("X6", "X9", 0.2)
+    bn.update_correlation_matrix(["X9"])
+    bn.add_node(name="X10", parents=["X2", "X7"], rank_corrs=[0.4, -0.3], distribution="norm", parameters_small=[0.0, 1.0], parameters_large=[0.0, 1.0])
+    bn.update_correlation_matrix(["X10"])
+
+    full = bn.model_copy(deep=True)
+    full.invalidate_graph()
+    full.calculate_correlation_matrix()
+    full.calculate_correlation_bounds()
+    np.testing.assert_allclose(bn.R, full.R, rtol=0, atol=1e-14)
+    for node in bn.nodes:
+        for edge in node.edges:
+            np.testing.assert_allclose(
+                bn.get_correlation_bounds(edge.parent, node.name), full.get_correlation_bounds(edge.parent, node.name), atol=1e-14
+            )
+
+
+def test_conditional_percentiles_match_the_samples_of_an_estimate():
+    from core.mcm import MCM, conditions_from_bn
+
+    bn = BayesianNetwork.model_validate_json(TEMPLATE.read_text())
+    bn._get_node_by_name("AC code").condition = "Code D"
+    bn._get_node_by_name("Mvts").condition = "80000"
+    bn.calculate_correlation_matrix()
+
+    mcm = MCM(bn, conditions_from_bn(bn), n=200000, seed=4, cache=None)
+    result = mcm.run()
+
+    percentiles = [5, 25, 50, 75, 95]
+    for name in ["L_RWY", "A_Apron", "L_TWY"]:
+        exact = bn.conditional_percentiles(name, percentiles, evidence=mcm.evidence, size=mcm.size)
+        sampled = np.percentile(result.design_vars[name], percentiles)
+        np.testing.assert_allclose(sampled, exact, rtol=0.01)
@@ -0,0 +1,45 @@
+import numpy as np
+
+from core.cache import InferenceCache
+
+
+def test_least_recently_used_results_are_evicted_first():
+    cache = InferenceCache(max_bytes=3 * 800)
+    for key in "abc":
+        cache.put(key, np.zeros(100))
+    assert cache.nbytes == 2400
+
+    # Using a makes b the least recently used result
+    cache.get("a")
+    cache.put("d", np.zeros(100))
+    assert "b" not in cache
+    assert all(key in cache for key in "acd")
+    assert cache.nbytes == 2400
+
+
+def test_memory_limit():
+    cache = InferenceCache(max_bytes=1000)
+
+    # Results larger than the limit are not stored
+    cache.put("large", np.zeros(200))
+    assert "large" not in cache
+    assert cache.nbytes == 0
+
+    cache.put("a", np.zeros(70))
+    cache.put("b", np.zeros(70))
+    assert "a" not in cache and "b" in cache
+    assert cache.nbytes == 560
+
+    # Replacing a result does not count it twice
+    cache.put("b", np.zeros(100))
+    assert len(cache) == 1 and cache.nbytes == 800
+
+    cache.set_max_bytes(500)
+    assert len(cache) == 0 and cache.nbytes == 0
+
+
+def test_cached_results_are_read_only():
+    cache = InferenceCache()
+    F = np.zeros(10)
+    cache.put("key", F)
+    assert not cache.get("key").flags.writeable
@@ -0,0 +1,44 @@
+import json
+import logging
+from pathlib import Path
+
+import pytest
+
+from core import cli
+from core.cli import main
+
+TEMPLATE = Path(__file__).resolve().parents[1] / "data" / "template.json"
+
+
+def test_estimate_without_ac_code_exits_with_message(tmp_path, caplog):
+    out = tmp_path / "results.npz"
+    with caplog.at_level(logging.ERROR):
+        code = main(["estimate", str(TEMPLATE), "--n", "100", "--out", str(out)])
+
+    assert code != 0
+    assert not out.exists()
+    assert "AC code" in caplog.text
+
+
+def test_estimate_with_ac_code_writes_results(tmp_path):
+    project = json.loads(TEMPLATE.read_text())
+    for node in project["nodes"]:
+        if node["name"] == "AC code":
+            node["condition"] = "Code C"
+    path = tmp_path / "project.json"
+    path.write_text(json.dumps(project))
+    out = tmp_path / "results.npz"
+
+    code = main(["estimate", str(path), "--n", "100", "--seed", "1", "--out", str(out)])
+
+    assert code == 0
+    assert out.exists()
+
+
+def test_other_errors_are_not_caught(monkeypatch):
+    def fail(**kwargs):
+        raise ValueError("matmul: size mismatch")
+
+    monkeypatch.setattr(cli, "estimate", fail)
+    with pytest.raises(ValueError, match="matmul"):
+        main(["estimate", str(TEMPLATE)])
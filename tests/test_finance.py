@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from core.finance import (
+    annuity,
+    discounted_cash_flow,
+    discounted_payback_period,
+    internal_rate_of_return,
+    net_present_value,
+)
+
+
+def test_net_present_value():
+    flows = np.array([[-100.0, 110.0], [-1000.0, 300.0], [50.0, 0.0]])
+    np.testing.assert_allclose(net_present_value(flows, 0.1), [0.0, -1000 + 300 / 1.1, 50.0], atol=1e-12)
+
+    # A rate per sample
+    np.testing.assert_allclose(net_present_value(flows[:1], np.array([0.0])), [10.0])
+
+
+def test_internal_rate_of_return():
+    flows = np.array([[-1000.0, 300.0, 400.0, 500.0], [-100.0, 60.0, 60.0, 0.0], [-100.0, -10.0, -10.0, -10.0]])
+    irr = internal_rate_of_return(flows)
+
+    # The IRR is the positive root of the NPV polynomial in 1 + rate
+    for row in range(2):
+        roots = np.roots(np.trim_zeros(flows[row], "b"))
+        growth = roots[np.isreal(roots) & (roots.real > 0)].real
+        assert irr[row] == pytest.approx(growth[0] - 1, abs=1e-10)
+    assert np.isnan(irr[2])
+
+
+def test_internal_rate_of_return_keeps_an_exact_first_guess():
+    # The first guess of the iteration (10%) is the root
+    flows = np.array([[-100.0, 110.0, 0.0], [-100.0, 50.0, 70.0]])
+    irr = internal_rate_of_return(flows)
+    assert irr[0] == 0.1
+    np.testing.assert_allclose(net_present_value(flows, irr), 0.0, atol=1e-8)
+
+
+def test_discounted_payback_period():
+    flows = np.array([[-100.0, 50.0, 50.0, 50.0], [-100.0, 50.0, 50.0, 50.0], [-100.0, 10.0, 10.0, 10.0], [0.0, 10.0, 10.0, 10.0]])
+    payback = discounted_payback_period(flows[[0, 2, 3]], 0.0)
+    np.testing.assert_allclose(payback, [2.0, np.inf, 0.0])
+
+    # At 10%, the investment is repaid in the third year, interpolated linearly within the year
+    discounted = flows[1] / 1.1 ** np.arange(4)
+    before = discounted[:3].sum()
+    expected = 2 + -before / discounted[3]
+    assert discounted_payback_period(flows[1:2], 0.1)[0] == pytest.approx(expected, rel=1e-12)
+
+
+def test_annuity():
+    assert annuity(1000.0, 0.05, 10) == pytest.approx(129.50457496545667, rel=1e-12)
+    assert annuity(1000.0, 0.0, 10) == pytest.approx(100.0)
+
+
+def test_discounted_cash_flow_does_not_depend_on_the_chunk_size():
+    capex = np.random.default_rng(5).uniform(5e7, 2e8, 1000)
+    kwargs = dict(landing_revenue=6e6, passenger_revenue=4e6, opex=2e6, discount_rate=0.06, years=30, mvts_growth=0.02, debt_share=0.5)
+
+    single = discounted_cash_flow(capex, **kwargs)
+    chunked = discounted_cash_flow(capex, memory_budget=6 * 8 * 31 * 64, **kwargs)
+    for name in ["NPV", "Discounted payback", "IRR"]:
+        np.testing.assert_array_equal(chunked[name], single[name])
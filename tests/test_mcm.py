@@ -0,0 +1,66 @@
+from pathlib import Path
+
+import numpy as np
+
+from core.bn import BayesianNetwork
+from core.mcm import MCM, conditions_from_bn
+
+TEMPLATE = Path(__file__).resolve().parents[1] / "data" / "template.json"
+
+
+def load_network(ac_code="Code C"):
+    bn = BayesianNetwork.model_validate_json(TEMPLATE.read_text())
+    bn._get_node_by_name("AC code").condition = ac_code
+    bn.calculate_correlation_matrix()
+    return bn
+
+
+def test_run_uses_the_snapshot_of_the_network():
+    bn = load_network()
+    expected = MCM(bn, conditions_from_bn(bn), n=1000, seed=1, cache=None).run()
+
+    mcm = MCM(bn, conditions_from_bn(bn), n=1000, seed=1, cache=None)
+    mcm.snapshot()
+
+    # Edit the network as the user interface would while the estimate runs
+    bn.add_node(parents=["L_RWY"], rank_corrs=[0.5], distribution="norm", parameters_small=[0.0, 1.0], parameters_large=[0.0, 1.0])
+    bn._get_node_by_name("Mvts").condition = "1000"
+    bn.update_correlation_matrix([bn.nodes[-1].name])
+
+    result = mcm.run()
+    assert result.names == expected.names
+    np.testing.assert_array_equal(result.sim_data["Simulation"], expected.sim_data["Simulation"])
+
+
+def test_cancel_stops_the_inference_loop(monkeypatch):
+    from core import sampler
+
+    bn = load_network()
+    mcm = MCM(bn, conditions_from_bn(bn), n=1000, seed=1, cache=None)
+
+    calls = []
+    from_normal = sampler.from_normal
+
+    def cancel_after_first_node(*args):
+        calls.append(args[0])
+        mcm.cancel()
+        return from_normal(*args)
+
+    monkeypatch.setattr(sampler, "from_normal", cancel_after_first_node)
+
+    assert mcm.run() is None
+    assert len(calls) == 1
+
+
+def test_adaptive_batches_use_one_definition_of_the_network():
+    bn = load_network()
+    settings = dict(n=3000, seed=1, cache=None, tolerance=1e-6, batch_size=1000)
+    expected = MCM(bn, conditions_from_bn(bn), **settings).run()
+
+    def edit_network(message):
+        # Change the evidence after the first batch has started
+        bn._get_node_by_name("L_RWY").condition = "3000"
+
+    result = MCM(bn, conditions_from_bn(bn), **settings).run(progress_callback=edit_network)
+    assert result.n == expected.n == 3000
+    np.testing.assert_array_equal(result.sim_data["Simulation"], expected.sim_data["Simulation"])
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from scipy.special import ndtr
+
+from core import sampler
+from core.bn import BayesianNetwork
+from core.cache import InferenceCache
+from core.mcm import MCM, conditions_from_bn
+
+TEMPLATE = Path(__file__).resolve().parents[1] / "data" / "template.json"
+
+
+@pytest.mark.parametrize(
+    "distribution, parameters",
+    [("triang", [0.3, 10.0, 90.0]), ("expon", [2.0, 3.0]), ("uniform", [1.0, 4.0]), ("gamma", [2.0, 0.0, 5.0])],
+)
+def test_quantile_table_matches_exact_ppf(distribution, parameters):
+    z = np.random.default_rng(0).standard_normal(100000)
+    exact = sampler.ppf(distribution, parameters, ndtr(z))
+    table = sampler.quantile_table(distribution, tuple(parameters))
+
+    np.testing.assert_allclose(table.from_normal(z), exact, rtol=0, atol=1e-5 * parameters[-1])
+    assert sampler.quantile_table(distribution, tuple(parameters)) is table
+
+
+def test_quantile_tables_are_part_of_the_cache_key():
+    bn = BayesianNetwork.model_validate_json(TEMPLATE.read_text())
+    bn._get_node_by_name("AC code").condition = "Code C"
+    conditions = conditions_from_bn(bn)
+    cache = InferenceCache()
+
+    exact = MCM(bn, conditions, n=2000, seed=1, cache=cache).run()
+    tables = MCM(bn, conditions, n=2000, seed=1, cache=cache, quantile_tables=True).run()
+
+    # The second run is not taken from the cache, but agrees within the table accuracy
+    assert not np.array_equal(exact.design_vars["L_RWY"], tables.design_vars["L_RWY"])
+    np.testing.assert_allclose(tables.sim_data["Simulation"], exact.sim_data["Simulation"], rtol=1e-4)
@@ -1,5 +1,4 @@
-import py_banshee
-from PyQt5.QtWidgets import QDialog, QWidget, QHBoxLayout, QVBoxLayout, QComboBox
+from PyQt5.QtWidgets import QDialog, QWidget, QHBoxLayout, QVBoxLayout, QComboBox, QLabel
 from PyQt5.QtCore import QObject, Qt
 
 import numpy as np
@@ -32,8 +31,9 @@ class ConditionalProbabilitiesDialog(QDialog):
 
         self.conditions = parent.mainwindow.input_form.conditions
 
-        MCM.define_bn(self)
-        MCM.conditional_probabilities(self)
+        # The marginals are calculated analytically from the BN, so no sampling is needed
+        self.mcm = MCM(self.bn, self.conditions)
+        self.mcm.define_bn()
 
         self.icon = parent.mainwindow.icon
         self.construct_dialog(node)
@@ -58,8 +58,6 @@ class ConditionalProbabilitiesDialog(QDialog):
         self.conditionalgraph = ConditionalGraph(self, node)
         self.plot_layout.addWidget(self.conditionalgraph)
 
-        MCM.conditional_probabilities(self)
-
         self.node_select = QComboBox()
         for node in self.bn.nodes:
             if node.condition != 'n.a.' or node.name == "AC code":
@@ -69,7 +67,29 @@ class ConditionalProbabilitiesDialog(QDialog):
 
         self.node_select.currentIndexChanged.connect(self.plot_cond_prob)
 
-        self.plot_layout.addWidget(self.node_select)
+        # Probability that the conditionalized design variable exceeds the given values
+        from ui.widgets import ParameterInputLine
+
+        self.side_layout = QVBoxLayout()
+        self.side_layout.addWidget(self.node_select)
+        self.side_layout.addWidget(QLabel("Exceedance probabilities:"))
+
+        self.lineedits = []
+        self.exc_prob_labels = []
+        for i in range(3):
+            lineedit = ParameterInputLine(label="P(x >", labelwidth=40)
+            label = QLabel("")
+            label.setFixedWidth(60)
+            lineedit.layout().addWidget(label)
+            self.side_layout.addWidget(lineedit)
+            self.lineedits.append(lineedit)
+            self.exc_prob_labels.append(label)
+        self.side_layout.addStretch()
+
+        self.signals = CondProbSignals(self)
+        self.signals.connect_signals()
+
+        self.plot_layout.addLayout(self.side_layout)
 
         self.setLayout(self.plot_layout)
 
@@ -78,6 +98,20 @@ class ConditionalProbabilitiesDialog(QDialog):
     def plot_cond_prob(self):
         node = self.node_select.currentText()
         self.conditionalgraph.update_plot_distributions(node)
+        for i, lineedit in enumerate(self.lineedits):
+            self._exc_prob_changed(i, lineedit.get_value())
+
+    def _exc_prob_changed(self, i, text):
+        """Calculate the exact exceedance probability of the value in line edit i in the conditional distribution"""
+        try:
+            value = float(text.replace(',', ''))
+        except ValueError:
+            self.exc_prob_labels[i].setText("")
+            return
+
+        node = self.conditionalgraph.node
+        probability = self.bn.exceedance_probability(node, [value], evidence=self.mcm.evidence, size=self.mcm.size)[0]
+        self.exc_prob_labels[i].setText(f") = {probability:.1%}")
 
 class CostVariablesDialog(QDialog):
 
@@ -154,31 +188,40 @@ class ConditionalGraph(QWidget):
 
         self.setLayout(self.condgraph_widget_layout)
 
+    def get_distributions(self, node):
+        """
+        Quantiles of the unconditional and conditional distribution of a node at n equally
+        spaced probabilities, calculated exactly from the BN. Their histograms follow the
+        distributions without sampling noise.
+        """
+        mcm = self.mainwindow.mcm
+        bn = self.mainwindow.bn
+        percentiles = 100 * (np.arange(mcm.n) + 0.5) / mcm.n
+        self.node = node
+
+        F_uncond = bn.conditional_percentiles(node, percentiles, size=mcm.size)
+        F_cond = bn.conditional_percentiles(node, percentiles, evidence=mcm.evidence, size=mcm.size)
+        return F_uncond, F_cond
+
+    def get_label(self, node, F, evidence=None):
+        """
+        Legend label with the mean and the exact median and 90% interval
+        """
+        mcm = self.mainwindow.mcm
+        p5, p50, p95 = self.mainwindow.bn.conditional_percentiles(node, [5, 50, 95], evidence=evidence, size=mcm.size)
+        return f'mean: {round(np.mean(F), 0):,}\n median: {round(p50, 0):,}\n 90%: {round(p5, 0):,} - {round(p95, 0):,}'
+
     def plot_distributions(self, node):
-        names = self.mainwindow.names
-        distributions = self.mainwindow.distributions
-        parameters = self.mainwindow.parameters
-        n = self.mainwindow.n
-        node_index = names.index(node)
-        dist, param = py_banshee.prediction.make_dist([distributions[node_index]], [parameters[node_index]])
-
-        F_cond = self.mainwindow.design_vars[node]
-
-        if len(parameters[node_index]) == 3:
-            F_uncond = dist[0].rvs(param[0][0], param[0][1], param[0][2], size=n)
-        elif len(parameters[node_index]) == 2:
-            F_uncond = dist[0].rvs(param[0][0], param[0][1], size=n)
-        else:
-            print('Parameters do not match!', parameters[node_index])
+        F_uncond, F_cond = self.get_distributions(node)
 
         self.conditional_graph = FigureCanvasQTAgg(Figure())
         self.conditional_ax = self.conditional_graph.figure.subplots()
 
         self.uncond_n, self.uncond_bins, self.uncond_patches = self.conditional_ax.hist(
-            F_uncond, bins=100, density=False, color='silver', edgecolor='silver', label=['un-conditionalized\n mean: ' + f'{round(np.mean(F_uncond), 0):,}']
+            F_uncond, bins=100, density=False, color='silver', edgecolor='silver', label=['un-conditionalized\n ' + self.get_label(node, F_uncond)]
         )
         self.cond_n, self.cond_bins, self.cond_patches = self.conditional_ax.hist(
-            F_cond, bins=100, density=False, color='cornflowerblue', edgecolor='cornflowerblue', label=['conditionalized\n mean: ' + f'{round(np.mean(F_cond), 0):,}']
+            F_cond, bins=100, density=False, color='cornflowerblue', edgecolor='cornflowerblue', label=['conditionalized\n ' + self.get_label(node, F_cond, evidence=self.mainwindow.mcm.evidence)]
         )
 
         self.conditional_ax.set_xlabel("x")
@@ -190,31 +233,17 @@ class ConditionalGraph(QWidget):
         self.conditional_graph.show()
 
     def update_plot_distributions(self, node):
-        names = self.mainwindow.names
-        distributions = self.mainwindow.distributions
-        parameters = self.mainwindow.parameters
-        n = self.mainwindow.n
-        node_index = names.index(node)
-        dist, param = py_banshee.prediction.make_dist([distributions[node_index]], [parameters[node_index]])
-
-        F_cond = self.mainwindow.design_vars[node]
-
-        if len(parameters[node_index]) == 3:
-            F_uncond = dist[0].rvs(param[0][0], param[0][1], param[0][2], size=n)
-        elif len(parameters[node_index]) == 2:
-            F_uncond = dist[0].rvs(param[0][0], param[0][1], size=n)
-        else:
-            print('Parameters do not match!', parameters[node_index])
+        F_uncond, F_cond = self.get_distributions(node)
 
         self.conditional_ax.clear()
 
         self.uncond_n, self.uncond_bins, self.uncond_patches = self.conditional_ax.hist(
             F_uncond, bins=100, density=False, color='silver', edgecolor='silver',
-            label=['un-conditionalized\n mean: ' + f'{round(np.mean(F_uncond), 0):,}']
+            label=['un-conditionalized\n ' + self.get_label(node, F_uncond)]
         )
         self.cond_n, self.cond_bins, self.cond_patches = self.conditional_ax.hist(
             F_cond, bins=100, density=False, color='cornflowerblue', edgecolor='cornflowerblue',
-            label=['conditionalized\n mean: ' + f'{round(np.mean(F_cond), 0):,}']
+            label=['conditionalized\n ' + self.get_label(node, F_cond, evidence=self.mainwindow.mcm.evidence)]
         )
 
         self.conditional_ax.set_xlabel("x")
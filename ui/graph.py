@@ -4,6 +4,7 @@ import logging
 
 import matplotlib.pyplot as plt
 import numpy as np
+from core.columns import ECDF, Columns
 from core.models import Node
 from core.threads import Worker
 from ui.menus import GraphContextMenu
@@ -607,6 +608,194 @@ class NodePatch:
             self.ax.figure.canvas.mpl_disconnect(self.cidrelease)
             self.ax.figure.canvas.mpl_disconnect(self.cidmotion)
 
+def percentile_name(p) -> str:
+    """Label of a percentile, e.g. '10th percentile'"""
+    if str(p)[-1] == "1":
+        return f"{p}st percentile"
+    elif str(p)[-1] == "2":
+        if len(str(p)) > 1 and str(p)[-2] == "1":
+            return f"{p}th percentile"
+        return f"{p}nd percentile"
+    elif str(p)[-1] == "3":
+        return f"{p}rd percentile"
+    return f"{p}th percentile"
+
+
+class DistributionPlot:
+    """Histogram of a sample with percentile lines and labels. The bars, lines and labels are
+    created once and updated in place when the data or the percentiles change. The bars and
+    lines are animated: the rest of the axes is cached after each full draw, so updates that
+    keep the axis limits only redraw (blit) the bars and lines.
+
+    Parameters
+    ----------
+    canvas : FigureCanvasQTAgg
+        Canvas of the figure
+    ax : matplotlib.axes.Axes
+        Axes for the histogram
+    percentile_layout : QHBoxLayout
+        Layout for the percentile labels. Labels are inserted before other widgets in the layout.
+    value_format : str
+        Format of the percentile values, e.g. "€ {:,}"
+    bins : int, optional
+        Number of bins, by default 100
+    """
+
+    def __init__(self, canvas, ax, percentile_layout, value_format, bins=100):
+        self.canvas = canvas
+        self.ax = ax
+        self.percentile_layout = percentile_layout
+        self.value_format = value_format
+
+        self.data = np.zeros(0)
+        self._ecdf = None
+        self.percentiles = []
+        self.percentile_labels = []
+        self.percentile_lines = []
+        self.background = None
+
+        edges = np.linspace(0, 1, bins + 1)
+        self.bars = self.ax.bar(
+            edges[:-1], np.zeros(bins), width=np.diff(edges), align="edge",
+            color="cornflowerblue", edgecolor="cornflowerblue", animated=True
+        )
+        self.edges = edges
+        self.canvas.mpl_connect("draw_event", self.on_draw)
+
+    def on_draw(self, event):
+        """Cache the axes after a full draw and draw the animated artists on top"""
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        for bar in self.bars:
+            self.ax.draw_artist(bar)
+        for line in self.percentile_lines:
+            self.ax.draw_artist(line)
+
+    def blit(self):
+        """Redraw the bars and lines on the cached axes, or the full canvas if there is no cache yet"""
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_animated()
+        self.canvas.blit(self.ax.bbox)
+
+    def redraw(self):
+        """Redraw the full canvas, e.g. after the axis limits changed"""
+        self.background = None
+        self.canvas.draw_idle()
+
+    @property
+    def ecdf(self) -> ECDF:
+        """Empirical distribution of the data for the percentiles, sorted on first use"""
+        if self._ecdf is None:
+            self._ecdf = ECDF(self.data)
+        return self._ecdf
+
+    def set_data(self, data, ecdf=None):
+        """Bin new data into the existing bars (density) and move the percentile lines. The axes
+        are only redrawn if the bins or the height of the histogram changed considerably.
+
+        Parameters
+        ----------
+        data : np.ndarray
+            Sample. Values that are not finite are not binned.
+        ecdf : ECDF, optional
+            Empirical distribution of the data, if it is shared with other views (see
+            Columns.ecdf). By default None, which creates it when the percentiles are needed.
+        """
+        self.data = np.asarray(data, dtype=np.float64).ravel()
+        self._ecdf = ecdf
+        finite = self.data[np.isfinite(self.data)]
+
+        if len(finite) > 0:
+            low, high = finite.min(), finite.max()
+            if low == high:
+                low, high = low - 0.5, high + 0.5
+            # Keep the bins while they cover the data and are not much wider, so small changes
+            # (e.g. dragging a slider) do not rescale the axes
+            if self.edges[0] <= low and high <= self.edges[-1] and high - low > 0.5 * (self.edges[-1] - self.edges[0]):
+                low, high = self.edges[0], self.edges[-1]
+            counts, edges = np.histogram(finite, bins=len(self.bars), range=(low, high))
+            heights = counts / (len(finite) * np.diff(edges))
+        else:
+            edges = self.edges
+            heights = np.zeros(len(self.bars))
+
+        for bar, x, width, height in zip(self.bars, edges[:-1], np.diff(edges), heights):
+            bar.set_x(x)
+            bar.set_width(width)
+            bar.set_height(height)
+
+        # Keep the axis limits while the histogram fits and does not become much lower
+        top = self.ax.get_ylim()[1]
+        same_bins = np.array_equal(edges, self.edges)
+        self.edges = edges
+        self.update_percentile_values()
+
+        if same_bins and 0.5 * top < heights.max() <= top:
+            self.blit()
+            return
+
+        margin = 0.05 * (edges[-1] - edges[0])
+        self.ax.set_xlim(edges[0] - margin, edges[-1] + margin)
+        self.ax.set_ylim(0, 1.05 * heights.max() if heights.max() > 0 else 1)
+        self.redraw()
+
+    def set_percentiles(self, percentiles):
+        """Show other percentiles. Existing labels and lines are reused.
+
+        Parameters
+        ----------
+        percentiles : List[float]
+            Percentiles (0-100)
+        """
+        self.percentiles = list(percentiles)
+
+        while len(self.percentile_labels) > len(self.percentiles):
+            for label in self.percentile_labels.pop():
+                label.deleteLater()
+            self.percentile_lines.pop().remove()
+
+        while len(self.percentile_labels) < len(self.percentiles):
+            label = QLabel()
+            label.setFont(QFont("Arial", 10, QFont.Bold))
+            label.setFixedWidth(100)
+            value_label = QLabel()
+            value_label.setFixedWidth(100)
+
+            position = 2 * len(self.percentile_labels)
+            self.percentile_layout.insertWidget(position, label)
+            self.percentile_layout.insertWidget(position + 1, value_label)
+            self.percentile_labels.append((label, value_label))
+
+            line = self.ax.axvline(x=0, ymin=0, ymax=1, color="black", linestyle="--", animated=True)
+            self.percentile_lines.append(line)
+
+        for p, (label, _) in zip(self.percentiles, self.percentile_labels):
+            label.setText(percentile_name(p))
+
+        self.update_percentile_values()
+        self.blit()
+
+    def update_percentile_values(self):
+        """Look up the percentiles in the empirical distribution and update the labels and lines"""
+        if len(self.percentiles) == 0:
+            return
+
+        values = np.atleast_1d(self.ecdf.percentile(self.percentiles))
+        for value, (_, value_label), line in zip(values, self.percentile_labels, self.percentile_lines):
+            if np.isfinite(value):
+                value_label.setText(self.value_format.format(int(value)))
+                line.set_xdata([value, value])
+                line.set_visible(True)
+            else:
+                value_label.setText("n.a.")
+                line.set_visible(False)
+
+
 class EstimateGraph(QWidget):
     def __init__(self, mainwindow):
         super().__init__()
@@ -664,56 +853,26 @@ class EstimateGraph(QWidget):
         self.estimate_percentiles = percentiles
 
         self.estimate_ax = self.estimate_graph.figure.subplots()
+        self.estimate_ax.set_xlabel("Investment Cost")
+        self.estimate_ax.set_ylabel("Probability")
 
-        # self.estimate_n, self.estimate_bins, self.estimate_patches = self.estimate_ax.hist(
-        #     self.sim_data['Rough estimate'], bins=100, density=True, color='silver', edgecolor='silver'
-        # )
-        self.sim_n, self.sim_bins, self.sim_patches = self.estimate_ax.hist(
-            self.sim_data['Simulation'], bins=100, density=True, color='cornflowerblue', edgecolor='cornflowerblue'
-        )
-
-        # Calculate and plot percentiles
+        # Histogram and percentiles, updated in place when the data or percentiles change
         self.percentile_layout = QHBoxLayout()
+        self.percentile_layout.addWidget(self.edit_percentile_button)
 
-        self.percentile_labels = []
-        self.percentile_lines = []
-
-        for p in self.estimate_percentiles:
-            if str(p)[-1] == "1":
-                label = QLabel(f"{p}st percentile")
-            elif str(p)[-1] == "2":
-                if len(str(p)) > 1 and str(p)[-2] == "1":
-                    label = QLabel(f"{p}th percentile")
-                else:
-                    label = QLabel(f"{p}nd percentile")
-            elif str(p)[-1] == "3":
-                label = QLabel(f"{p}rd percentile")
-            else:
-                label = QLabel(f"{p}th percentile")
-
-            label.setFont(QFont("Arial", 10, QFont.Bold))
-            label.setFixedWidth(100)
-
-            p_value = int(np.percentile(self.sim_data['Simulation'], p))
-            value = QLabel(str(f"€ {p_value:,}"))
-            value.setFixedWidth(100)
-
-            self.percentile_layout.addWidget(label)
-            self.percentile_layout.addWidget(value)
-
-            self.percentile_labels.append((label, value))
-
-            line = self.estimate_ax.axvline(x=p_value, ymin=0, ymax=1, color="black", linestyle="--")
-            self.percentile_lines.append(line)
-
-        self.estimate_ax.set_xlabel("Investment Cost")
-        self.estimate_ax.set_ylabel("Probability")
+        self.estimate_plot = DistributionPlot(self.estimate_graph, self.estimate_ax, self.percentile_layout, "€ {:,}")
+        self.estimate_plot.set_percentiles(self.estimate_percentiles)
+        self.estimate_plot.set_data(self.sim_data['Simulation'], ecdf=self.simulation_ecdf())
 
         self.estimate_graph.draw()
 
         self.estimate_graph.show()
 
-        self.percentile_layout.addWidget(self.edit_percentile_button)
+    def simulation_ecdf(self):
+        """Empirical distribution of the Simulation estimate, shared with the other users of the results"""
+        if isinstance(self.sim_data, Columns):
+            return self.sim_data.ecdf('Simulation')
+        return None
 
     def edit_percentiles(self):
         if self.p_window == None:
@@ -723,110 +882,12 @@ class EstimateGraph(QWidget):
     def update_percentiles(self, percentiles):
         self.p_window = None
         self.estimate_percentiles = percentiles
-        self.estimate_ax.clear()
-
-        # self.estimate_n, self.estimate_bins, self.estimate_patches = self.estimate_ax.hist(
-        #     self.sim_data['Rough estimate'], bins=100, density=True, color='silver', edgecolor='silver'
-        # )
-        self.sim_n, self.sim_bins, self.sim_patches = self.estimate_ax.hist(
-            self.sim_data['Simulation'], bins=100, density=True, color='cornflowerblue', edgecolor='cornflowerblue'
-        )
-
-        for label, value_label in self.percentile_labels:
-            label.deleteLater()
-            value_label.deleteLater()
-
-        self.percentile_labels.clear()
-
-        for p in self.estimate_percentiles:
-            p_value = int(np.percentile(self.sim_data['Simulation'], p))
-
-            if str(p)[-1] == "1":
-                label = QLabel(f"{p}st percentile")
-            elif str(p)[-1] == "2":
-                if len(str(p)) > 1 and str(p)[-2] == "1":
-                    label = QLabel(f"{p}th percentile")
-                else:
-                    label = QLabel(f"{p}nd percentile")
-            elif str(p)[-1] == "3":
-                label = QLabel(f"{p}rd percentile")
-            else:
-                label = QLabel(f"{p}th percentile")
-
-            label.setFont(QFont("Arial", 10, QFont.Bold))
-            label.setFixedWidth(100)
-
-            value_label = QLabel(str(f"€ {p_value:,}"))
-            value_label.setFixedWidth(100)
-
-            self.percentile_layout.addWidget(label)
-            self.percentile_layout.addWidget(value_label)
-
-            self.percentile_labels.append((label, value_label))
-
-            line = self.estimate_ax.axvline(x=p_value, ymin=0, ymax=1, color="black", linestyle="--")
-            self.percentile_lines.append(line)
-
-        self.estimate_ax.set_xlabel("Investment Cost")
-        self.estimate_ax.set_ylabel("Probability")
-
-        self.estimate_graph.draw()
-
-        self.percentile_layout.addWidget(self.edit_percentile_button)
+        self.estimate_plot.set_percentiles(self.estimate_percentiles)
 
     def update_data(self, newdata):
         self.sim_data = newdata
         self.p_window = None
-        self.estimate_ax.clear()
-
-        # self.estimate_n, self.estimate_bins, self.estimate_patches = self.estimate_ax.hist(
-        #     self.sim_data['Rough estimate'], bins=100, density=True, color='silver', edgecolor='silver'
-        # )
-        self.sim_n, self.sim_bins, self.sim_patches = self.estimate_ax.hist(
-            self.sim_data['Simulation'], bins=100, density=True, color='cornflowerblue', edgecolor='cornflowerblue'
-        )
-
-        for label, value_label in self.percentile_labels:
-            label.deleteLater()
-            value_label.deleteLater()
-
-        self.percentile_labels.clear()
-
-        for p in self.estimate_percentiles:
-            p_value = int(np.percentile(self.sim_data['Simulation'], p))
-
-            if str(p)[-1] == "1":
-                label = QLabel(f"{p}st percentile")
-            elif str(p)[-1] == "2":
-                if len(str(p)) > 1 and str(p)[-2] == "1":
-                    label = QLabel(f"{p}th percentile")
-                else:
-                    label = QLabel(f"{p}nd percentile")
-            elif str(p)[-1] == "3":
-                label = QLabel(f"{p}rd percentile")
-            else:
-                label = QLabel(f"{p}th percentile")
-
-            label.setFont(QFont("Arial", 10, QFont.Bold))
-            label.setFixedWidth(100)
-
-            value_label = QLabel(str(f"€ {p_value:,}"))
-            value_label.setFixedWidth(100)
-
-            self.percentile_layout.addWidget(label)
-            self.percentile_layout.addWidget(value_label)
-
-            self.percentile_labels.append((label, value_label))
-
-            line = self.estimate_ax.axvline(x=p_value, ymin=0, ymax=1, color="black", linestyle="--")
-            self.percentile_lines.append(line)
-
-        self.estimate_ax.set_xlabel("Investment Cost")
-        self.estimate_ax.set_ylabel("Probability")
-
-        self.estimate_graph.draw()
-
-        self.percentile_layout.addWidget(self.edit_percentile_button)
+        self.estimate_plot.set_data(self.sim_data['Simulation'], ecdf=self.simulation_ecdf())
 
 
 class PercentileForm(QWidget):
@@ -905,54 +966,21 @@ class PaybackGraph(QWidget):
         self.payback_percentiles = percentiles
 
         self.payback_ax = self.payback_graph.figure.subplots()
+        self.payback_ax.set_xlabel("Payback Period")
+        self.payback_ax.set_ylabel("Probability")
 
-        self.sim_n, self.sim_bins, self.sim_patches = self.payback_ax.hist(
-            self.sim_data, bins=100, density=True, color='cornflowerblue', edgecolor='cornflowerblue'
-        )
-
-        # Calculate and plot percentiles
+        # Histogram and percentiles, updated in place when the data or percentiles change
         self.percentile_layout = QHBoxLayout()
+        self.percentile_layout.addWidget(self.edit_percentile_button)
 
-        self.percentile_labels = []
-        self.percentile_lines = []
-
-        for p in self.payback_percentiles:
-            if str(p)[-1] == "1":
-                label = QLabel(f"{p}st percentile")
-            elif str(p)[-1] == "2":
-                if len(str(p)) > 1 and str(p)[-2] == "1":
-                    label = QLabel(f"{p}th percentile")
-                else:
-                    label = QLabel(f"{p}nd percentile")
-            elif str(p)[-1] == "3":
-                label = QLabel(f"{p}rd percentile")
-            else:
-                label = QLabel(f"{p}th percentile")
-
-            label.setFont(QFont("Arial", 10, QFont.Bold))
-            label.setFixedWidth(100)
-
-            p_value = int(np.percentile(self.sim_data, p))
-            value = QLabel(str(f"{p_value:,} years"))
-            value.setFixedWidth(100)
-
-            self.percentile_layout.addWidget(label)
-            self.percentile_layout.addWidget(value)
-
-            self.percentile_labels.append((label, value))
-
-            line = self.payback_ax.axvline(x=p_value, ymin=0, ymax=1, color="black", linestyle="--")
-            self.percentile_lines.append(line)
-
-        self.payback_ax.set_xlabel("Payback Period")
-        self.payback_ax.set_ylabel("Probability")
+        self.payback_plot = DistributionPlot(self.payback_graph, self.payback_ax, self.percentile_layout, "{:,} years")
+        self.payback_plot.set_percentiles(self.payback_percentiles)
+        self.payback_plot.set_data(self.sim_data)
 
         self.payback_graph.draw()
 
         self.payback_graph.show()
 
-        self.percentile_layout.addWidget(self.edit_percentile_button)
-
     def edit_percentiles(self):
         if self.p_window == None:
             self.p_window = PercentileForm(self.update_percentiles)
@@ -961,102 +989,10 @@ class PaybackGraph(QWidget):
     def update_percentiles(self, percentiles):
         self.p_window = None
         self.payback_percentiles = percentiles
-        self.payback_ax.clear()
-
-        self.sim_n, self.sim_bins, self.sim_patches = self.payback_ax.hist(
-            self.sim_data, bins=100, density=True, color='cornflowerblue', edgecolor='cornflowerblue'
-        )
-
-        for label, value_label in self.percentile_labels:
-            label.deleteLater()
-            value_label.deleteLater()
-
-        self.percentile_labels.clear()
-
-        for p in self.payback_percentiles:
-            p_value = int(np.percentile(self.sim_data, p))
-
-            if str(p)[-1] == "1":
-                label = QLabel(f"{p}st percentile")
-            elif str(p)[-1] == "2":
-                if len(str(p)) > 1 and str(p)[-2] == "1":
-                    label = QLabel(f"{p}th percentile")
-                else:
-                    label = QLabel(f"{p}nd percentile")
-            elif str(p)[-1] == "3":
-                label = QLabel(f"{p}rd percentile")
-            else:
-                label = QLabel(f"{p}th percentile")
-
-            label.setFont(QFont("Arial", 10, QFont.Bold))
-            label.setFixedWidth(100)
-
-            value_label = QLabel(str(f"{p_value:,} years"))
-            value_label.setFixedWidth(100)
-
-            self.percentile_layout.addWidget(label)
-            self.percentile_layout.addWidget(value_label)
-
-            self.percentile_labels.append((label, value_label))
-
-            line = self.payback_ax.axvline(x=p_value, ymin=0, ymax=1, color="black", linestyle="--")
-            self.percentile_lines.append(line)
-
-        self.payback_ax.set_xlabel("Payback Period")
-        self.payback_ax.set_ylabel("Probability")
-
-        self.payback_graph.draw()
-
-        self.percentile_layout.addWidget(self.edit_percentile_button)
+        self.payback_plot.set_percentiles(self.payback_percentiles)
 
     def update_data(self, newdata):
         logger.info("Plotting new payback period estimates.")
         self.sim_data = newdata
         self.p_window = None
-        self.payback_ax.clear()
-
-        self.sim_n, self.sim_bins, self.sim_patches = self.payback_ax.hist(
-            self.sim_data, bins=100, density=True, color='cornflowerblue', edgecolor='cornflowerblue'
-        )
-
-        for label, value_label in self.percentile_labels:
-            label.deleteLater()
-            value_label.deleteLater()
-
-        self.percentile_labels.clear()
-
-        for p in self.payback_percentiles:
-            p_value = int(np.percentile(self.sim_data, p))
-
-            if str(p)[-1] == "1":
-                label = QLabel(f"{p}st percentile")
-            elif str(p)[-1] == "2":
-                if len(str(p)) > 1 and str(p)[-2] == "1":
-                    label = QLabel(f"{p}th percentile")
-                else:
-                    label = QLabel(f"{p}nd percentile")
-            elif str(p)[-1] == "3":
-                label = QLabel(f"{p}rd percentile")
-            else:
-                label = QLabel(f"{p}th percentile")
-
-            label.setFont(QFont("Arial", 10, QFont.Bold))
-            label.setFixedWidth(100)
-
-            value_label = QLabel(str(f"{p_value:,} years"))
-            value_label.setFixedWidth(100)
-
-            self.percentile_layout.addWidget(label)
-            self.percentile_layout.addWidget(value_label)
-
-            self.percentile_labels.append((label, value_label))
-
-            line = self.payback_ax.axvline(x=p_value, ymin=0, ymax=1, color="black", linestyle="--")
-            self.percentile_lines.append(line)
-
-        self.payback_ax.set_xlabel("Payback Period")
-        self.payback_ax.set_ylabel("Probability")
-
-        self.payback_graph.draw()
-
-        self.percentile_layout.addWidget(self.edit_percentile_button)
\ No newline at end of file
+        self.payback_plot.set_data(self.sim_data)
@@ -1,7 +1,6 @@
 import matplotlib.pyplot as plt
 import numpy as np
 from ui import widgets, conditional
-from core.mcm import MCM
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 from matplotlib.collections import EllipseCollection
 from PyQt5.QtWidgets import QWidget, QPushButton
@@ -167,8 +166,6 @@ class MatrixWidget(QWidget):
 
     def plot_conditional_probabilities(self):
         self.conditions = self.mainwindow.input_form.conditions
-        MCM.define_bn(self)
-        MCM.conditional_probabilities(self)
         for node in self.bn.nodes:
             if node.condition == 'n.a.':
                 self.plot_conditional_dialog = conditional.ConditionalProbabilitiesDialog(self, node.name)
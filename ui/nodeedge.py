@@ -1,3 +1,5 @@
+from core.bn import calculate_bounds_snapshot
+from core.threads import Worker
 from ui import widgets, menus
 from PyQt5.Qt import *
 from PyQt5.QtCore import *
@@ -25,6 +27,14 @@ class NodeEdgeWidget(QWidget):
         self.nodeview.selectionModel().currentRowChanged.connect(self.emit_node_selected)
         self.edgeview.selectionModel().currentRowChanged.connect(self.emit_edge_selected)
 
+        # Calculate the bounds of the visible edges once scrolling pauses
+        self.bounds_workers = set()
+        self.bounds_timer = QTimer(self)
+        self.bounds_timer.setSingleShot(True)
+        self.bounds_timer.setInterval(50)
+        self.bounds_timer.timeout.connect(self.start_bounds_worker)
+        self.edgeview.verticalScrollBar().valueChanged.connect(self.update_visible_bounds)
+
     def set_selection(self, obj):
 
         # If selection is node
@@ -108,6 +118,41 @@ class NodeEdgeWidget(QWidget):
     def _emit_layout_changed(self):
         self.edgemodel.layoutChanged.emit()
         self.nodemodel.layoutChanged.emit()
+        self.update_visible_bounds()
+
+    def update_visible_bounds(self, *args):
+        """Schedule the calculation of the stale correlation bounds of the visible edges. The timer
+        is restarted on every call, so scrolling starts one calculation when it pauses."""
+        self.bounds_timer.start()
+
+    def start_bounds_worker(self):
+        """Calculate the stale correlation bounds of the visible edges in a background thread. The
+        inputs are copied here, so the worker does not read the network while it is edited."""
+        first = self.edgeview.rowAt(0)
+        if first < 0:
+            return None
+        last = self.edgeview.rowAt(self.edgeview.viewport().height() - 1)
+        if last < 0:
+            last = self.edgemodel.rowCount() - 1
+
+        bn = self.project.bn
+        children = list({edge.child for edge in self.edgemodel.modellist[first : last + 1]})
+        snapshot = bn.bounds_snapshot(children)
+        if len(snapshot["nodes"]) == 0:
+            return None
+
+        worker = Worker(calculate_bounds_snapshot, snapshot)
+        # The worker is kept alive by this widget until it is done, not by the thread pool
+        worker.setAutoDelete(False)
+        worker.result.connect(lambda result, worker=worker, bn=bn: self.on_bounds_result(result, worker, bn))
+        worker.error.connect(lambda error, worker=worker: self.bounds_workers.discard(worker))
+        self.bounds_workers.add(worker)
+        QThreadPool.globalInstance().start(worker)
+
+    def on_bounds_result(self, result, worker, bn):
+        """Store the calculated bounds in the network they were calculated for"""
+        self.bounds_workers.discard(worker)
+        bn.apply_correlation_bounds(result)
 
 
 class ReorderTableView(QTableView):
@@ -457,6 +502,12 @@ class EdgeListsModel(ListsModel):
             elif self.keys[col] == "rank_corr":
                 result = self.modellist[row].uncond_rstring + " = " + result
 
+        # Show the possible range of the non-conditional correlation
+        elif role == Qt.ToolTipRole and self.keys[index.column()] == "rank_corr":
+            edge = self.modellist[index.row()]
+            bounds = self.project.bn.get_correlation_bounds(edge.parent, edge.child)
+            result = "Possible range: ({:.3g}, {:.3g})".format(*bounds)
+
         return result
 
     def flags(self, index) -> Qt.ItemFlags:
@@ -4,8 +4,10 @@ import re
 import logging
 from PyQt5.QtWidgets import QWidget, QHBoxLayout, QVBoxLayout, QGridLayout, QSplitter, QFrame, QTabWidget, QGroupBox, QLabel, QLineEdit, QComboBox, QCheckBox, QPushButton, QLayout, QSpacerItem, QSizePolicy, QSlider
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThreadPool, QTimer
+from core import finance
 from core.mcm import MCM
+from core.threads import Worker
 import numpy as np
 from ui.conditional import ConditionalProbabilitiesDialog, CostVariablesDialog
 from ui.dialogs import NotificationDialog
@@ -651,6 +653,46 @@ class InputForm(QWidget):
             input_layout.addWidget(QLabel("€"))
             self.left_layout.addLayout(input_layout)
 
+        # Add simulation settings for adaptive sampling
+        self.simulation_label = QLabel("Simulation settings")
+        self.simulation_label.setFont(QFont("Arial", 12, QFont.Bold))
+        self.left_layout.addWidget(self.simulation_label)
+
+        self.simulation_settings = {
+            "Tolerance": None,
+            "Time budget": None
+        }
+        units = {"Tolerance": "% (empty for a fixed sample size)", "Time budget": "s"}
+
+        for field in self.simulation_settings:
+            input_layout = QHBoxLayout()
+            input_layout.setAlignment(Qt.AlignLeft)
+            label = QLabel(field)
+            label.setFixedWidth(200)
+            input_field = QLineEdit()
+            input_field.setFixedWidth(200)
+
+            self.simulation_settings[field] = input_field
+
+            input_layout.addWidget(label)
+            input_layout.addWidget(input_field)
+            input_layout.addWidget(QLabel(units[field]))
+            self.left_layout.addLayout(input_layout)
+
+        # Sampling method, Sobol' points need far fewer samples for the same accuracy
+        self.sampling_methods = {"Monte Carlo": "mc", "Latin hypercube": "lhs", "Sobol' (quasi-Monte Carlo)": "sobol"}
+        input_layout = QHBoxLayout()
+        input_layout.setAlignment(Qt.AlignLeft)
+        label = QLabel("Sampling method")
+        label.setFixedWidth(200)
+        self.sampling_input = QComboBox()
+        self.sampling_input.setFixedWidth(200)
+        for method in self.sampling_methods:
+            self.sampling_input.addItem(method)
+        input_layout.addWidget(label)
+        input_layout.addWidget(self.sampling_input)
+        self.left_layout.addLayout(input_layout)
+
         # Add input for add-ons (unit price)
         self.addons_label = QLabel("Add-ons")
         self.addons_label.setFont(QFont("Arial", 12, QFont.Bold))
@@ -701,11 +743,23 @@ class InputForm(QWidget):
 
             self.addons[addon] = checkbox
 
-        # Add a submit button
+        # Add a submit button, and a button to cancel a running estimate
         self.submit_button = QPushButton("Calculate Cost", self)
         self.submit_button.clicked.connect(self.on_submit)
         self.info_layout.addWidget(self.submit_button)
 
+        self.cancel_button = QPushButton("Cancel", self)
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.on_cancel)
+        self.progress_label = QLabel("")
+        self.run_widget = QWidget()
+        self.run_widget.setLayout(HLayout([self.cancel_button, self.progress_label], stretch=[0, 1]))
+        self.info_layout.addWidget(self.run_widget)
+
+        # Estimates run on a background thread, so the window stays responsive
+        self.threadpool = QThreadPool()
+        self.mcm = None
+
         # Set the layout
         self.setLayout(self.main_layout)
 
@@ -751,6 +805,16 @@ class InputForm(QWidget):
 
         self.conditions = ac_code | self.project_parameters | self.prices | self.additions
 
+        # Adaptive sampling, if a tolerance is given
+        try:
+            tolerance = self.simulation_settings["Tolerance"].text()
+            self.tolerance = float(tolerance) / 100 if tolerance != '' else None
+            time_budget = self.simulation_settings["Time budget"].text()
+            self.time_budget = float(time_budget) if time_budget != '' else None
+        except ValueError:
+            NotificationDialog(text="The tolerance and time budget must be numbers.", severity="critical")
+            return
+
         logger.info('Conditionalising...')
         self.conditionalise()
 
@@ -788,11 +852,75 @@ class InputForm(QWidget):
 
             self.signals.cond_val_about_to_change.emit(vars[key], str(value))
 
-        MCM.define_bn(self)
-        logger.info('Calculating conditional probabilities.')
-        MCM.conditional_probabilities(self)
-        logger.info('Starting design simulations.')
-        MCM.pavement_design(self)
+        self.mcm = MCM(
+            self.bn,
+            self.conditions,
+            n=1e6 if self.tolerance is not None else 100000,
+            tolerance=self.tolerance,
+            percentiles=self.mainwindow.cost_widget.estimate_percentiles,
+            time_budget=self.time_budget,
+            sampling=self.sampling_methods[self.sampling_input.currentText()],
+        )
+        # The worker only uses this snapshot, so the network can be edited while it runs
+        self.mcm.snapshot()
+
+        self.worker = Worker(self.mcm.run)
+        # The worker is kept alive by this widget, not by the thread pool
+        self.worker.setAutoDelete(False)
+        self.worker.progress.connect(self.on_progress)
+        self.worker.result.connect(lambda result, mcm=self.mcm: self.on_result(result, mcm))
+        self.worker.error.connect(lambda error, mcm=self.mcm: self.on_error(error, mcm))
+        self.worker.finished.connect(lambda mcm=self.mcm: self.on_finished(mcm))
+
+        self.set_running(True)
+        self.threadpool.start(self.worker)
+
+    def set_running(self, running):
+        """
+        Enable or disable the buttons, depending on whether an estimate is running
+        """
+        self.submit_button.setEnabled(not running)
+        self.cancel_button.setEnabled(running)
+
+    def on_progress(self, message):
+        logger.info(message)
+        self.progress_label.setText(message)
+
+    def on_cancel(self):
+        if self.mcm is not None:
+            self.mcm.cancel()
+        # A new estimate can be started once the worker has stopped, see on_finished
+        self.cancel_button.setEnabled(False)
+        self.progress_label.setText("Cancelling...")
+
+    def on_finished(self, mcm):
+        if mcm is not self.mcm:
+            return
+
+        self.set_running(False)
+        if mcm.cancelled:
+            self.progress_label.setText("Cancelled.")
+            logger.info('Estimate cancelled.')
+
+    def on_error(self, error, mcm):
+        # Errors of a cancelled or superseded run are discarded
+        if mcm is not self.mcm or mcm.cancelled:
+            return
+
+        exctype, value, tb = error
+        self.progress_label.setText("")
+        NotificationDialog(text=str(value), severity="critical", details=tb)
+
+    def on_result(self, result, mcm):
+        # Results of a cancelled or superseded run are discarded
+        if mcm is not self.mcm or mcm.cancelled:
+            return
+
+        self.progress_label.setText("")
+
+        self.sim_data = result.sim_data
+        self.mainwindow.simulated_cost = result.simulated_cost
+        self.signals.simdata_about_to_be_updated.emit(self.sim_data)
 
         if self.mainwindow.thirdwindow is not None:
             self.mainwindow.thirdwindow.charge_widget.calc_WACC()
@@ -808,9 +936,16 @@ class AirportCharges(QWidget):
         self.signals.airportcharges_changed.connect(lambda: self.set_window_modified.emit(True))
         self.mvts = self.mainwindow.no_mvts / 2
         self.pax = self.mainwindow.no_pax / 2
+        self.horizon = 40  # Years of operation for the discounted payback
         self.conditions = self.mainwindow.input_form.conditions
         self.calc_WACC()
 
+        # Recalculate the payback at most once per interval while a slider is dragged
+        self.payback_timer = QTimer(self)
+        self.payback_timer.setSingleShot(True)
+        self.payback_timer.setInterval(50)
+        self.payback_timer.timeout.connect(self.update_payback)
+
         self.ac_mix_layout = QVBoxLayout()
         self.ac_mix_title = QLabel("Mix of aircraft types:")
         self.ac_mix_title.setFont(QFont("Arial", 10, QFont.Bold))
@@ -892,10 +1027,22 @@ class AirportCharges(QWidget):
         self.opex_layout.addWidget(self.opex_input)
         self.opex_layout.addWidget(self.opex_value_label)
 
+        self.discount_check = QCheckBox("Discounted payback at the WACC")
+        self.growth_label = QLabel("Traffic growth (% per year):")
+        self.growth_input = QLineEdit("0")
+        self.growth_input.setAlignment(Qt.AlignHCenter)
+
+        self.discount_layout = QVBoxLayout()
+        self.discount_layout.setAlignment(Qt.AlignHCenter)
+        self.discount_layout.addWidget(self.discount_check)
+        self.discount_layout.addWidget(self.growth_label)
+        self.discount_layout.addWidget(self.growth_input)
+
         self.charges_layout.addLayout(self.ac_mix_layout)
         self.charges_layout.addLayout(self.slider_mvts_layout)
         self.charges_layout.addLayout(self.slider_pax_layout)
         self.charges_layout.addLayout(self.opex_layout)
+        self.charges_layout.addLayout(self.discount_layout)
 
         self.charges_layout.setAlignment(Qt.AlignCenter)
 
@@ -909,6 +1056,8 @@ class AirportCharges(QWidget):
         self.charge_pax_input.editingFinished.connect(self.charge_pax_input_changed)
         self.opex_input.valueChanged.connect(self.opex_input_changed)
         self.opex_value_label.editingFinished.connect(self.opex_input_value_changed)
+        self.discount_check.stateChanged.connect(self.schedule_payback)
+        self.growth_input.editingFinished.connect(self.schedule_payback)
 
     def define_ac_mix(self):
         MTOW = []
@@ -935,9 +1084,7 @@ class AirportCharges(QWidget):
         self.mvts_MTOW = np.average(MTOW) * self.mvts
 
         # Base scenario, 100% WACC split 1:2 between tonne MTOW and pax
-        self.base_charge = []
-        for sim in self.capex:
-            self.base_charge.append((self.wacc * sim) / (self.mvts_MTOW + 2 * self.pax))
+        self.base_charge = finance.base_charge(self.capex, self.wacc, self.mvts_MTOW, self.pax)
 
         try:
             self.charge_mvts.setValue(int(np.average(self.base_charge) * 100))
@@ -953,7 +1100,7 @@ class AirportCharges(QWidget):
     def charge_mvts_changed(self):
         value = self.charge_mvts.value()
         self.charge_mvts_input.setText(str(value / 100))
-        self.update_payback()
+        self.schedule_payback()
 
     def charge_mvts_input_changed(self):
         try:
@@ -968,7 +1115,7 @@ class AirportCharges(QWidget):
     def charge_pax_changed(self):
         value = self.charge_pax.value()
         self.charge_pax_input.setText(str(value/100))
-        self.update_payback()
+        self.schedule_payback()
 
 
     def charge_pax_input_changed(self):
@@ -984,7 +1131,7 @@ class AirportCharges(QWidget):
 
     def opex_input_changed(self):
         self.opex_value_label.setText(f'€ {int(self.opex_input.value()) * 1000:,}')
-        self.update_payback()
+        self.schedule_payback()
 
     def opex_input_value_changed(self):
         try:
@@ -995,33 +1142,46 @@ class AirportCharges(QWidget):
             self.opex_value_label.setText('€ 0')
 
     def calc_WACC(self):
-        self.capex = self.mainwindow.input_form.sim_data['Simulation']
-        g = 0.4
-        K_d = 0.07
-        T = 0.258
-        R_f = 0.04
-        EMRP = 0.05
-        EquityBeta = 0.7
-        self.wacc = g * K_d * (1 + T) + (1 - g) * (R_f + EMRP * EquityBeta)
-        self.max_revenue = []
-        for sim in self.capex:
-            self.max_revenue.append(self.wacc * sim)
+        self.capex = np.asarray(self.mainwindow.input_form.sim_data['Simulation'], dtype=np.float64)
+        self.wacc = finance.wacc(gearing=0.4, cost_of_debt=0.07, tax_rate=0.258, risk_free_rate=0.04, market_risk_premium=0.05, equity_beta=0.7)
+        self.max_revenue = self.wacc * self.capex
 
     def calc_revenue(self):
         logger.info('Calculating airport charges and revenue')
-        self.revenue = float(re.findall(r'[-+]?(?:\d{1,3}(?:,\d{3})*|\d+)(?:\.\d+)?(?:e[-+]?\d+)?', self.charge_mvts_input.text())[0].replace(',','')) * self.mvts + float(re.findall(r'[-+]?(?:\d{1,3}(?:,\d{3})*|\d+)(?:\.\d+)?(?:e[-+]?\d+)?', self.charge_pax_input.text())[0].replace(',','')) * self.pax
+        self.landing_revenue = float(re.findall(r'[-+]?(?:\d{1,3}(?:,\d{3})*|\d+)(?:\.\d+)?(?:e[-+]?\d+)?', self.charge_mvts_input.text())[0].replace(',','')) * self.mvts
+        self.passenger_revenue = float(re.findall(r'[-+]?(?:\d{1,3}(?:,\d{3})*|\d+)(?:\.\d+)?(?:e[-+]?\d+)?', self.charge_pax_input.text())[0].replace(',','')) * self.pax
+        self.revenue = self.landing_revenue + self.passenger_revenue
 
     def calc_payback(self):
         self.calc_revenue()
         self.opex = float(re.findall(r'[-+]?(?:\d{1,3}(?:,\d{3})*|\d+)(?:\.\d+)?(?:e[-+]?\d+)?', self.opex_value_label.text())[0].replace(',',''))
 
-        self.payback_period = []
-        for sim in self.capex:
-            self.payback_period.append(sim / (self.revenue - self.opex))
+        if self.discount_check.isChecked():
+            try:
+                growth = float(self.growth_input.text().replace('%', '')) / 100
+            except ValueError:
+                growth = 0.0
+                self.growth_input.setText('0')
+
+            # Discounted cash flows over the horizon, paid back periods beyond it are shown at the horizon
+            self.cash_flow = finance.discounted_cash_flow(self.capex, self.landing_revenue, self.passenger_revenue, self.opex, self.wacc, irr=False, years=self.horizon, mvts_growth=growth, pax_growth=growth)
+            self.payback_period = np.minimum(self.cash_flow['Discounted payback'], self.horizon)
+        else:
+            self.payback_period = finance.payback_period(self.capex, self.revenue, self.opex)
 
         logger.info("Payback period calculated")
 
+    def schedule_payback(self):
+        """Update the payback when the timer runs out, so dragging a slider does not queue a
+        recalculation for every value. The timer is not restarted while it runs, so the payback
+        follows a continuous drag at the timer interval. The update reads the sliders when the
+        timer runs out, and a later change starts the timer again, so the final values are
+        always applied."""
+        if not self.payback_timer.isActive():
+            self.payback_timer.start()
+
     def update_payback(self):
+        self.payback_timer.stop()
         self.calc_payback()
         self.mainwindow.mainwindow.signals.airportcharges_about_to_change.emit(self.payback_period)
 
@@ -1064,8 +1224,7 @@ class SimulationBreakdown(QWidget):
             self.conditions = self.mainwindow.input_form.conditions
         except:
             pass
-        MCM.define_bn(self)
-        MCM.conditional_probabilities(self)
+        # The dialog calculates the conditional distributions analytically from the BN
         for node in self.bn.nodes:
             if node.condition == 'n.a.':
                 self.plot_conditional_dialog = ConditionalProbabilitiesDialog(self, node.name)